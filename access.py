@@ -0,0 +1,302 @@
+import collections
+import hashlib
+import hmac
+import os
+import random
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+
+import streamlit as st
+
+from metrics import get_metrics
+
+# ==========================================
+# 访问控制：免费试用 + 解锁码 (持久化的授权记录)
+# ==========================================
+# 每个浏览器由 URL 上的 ?client=<随机串> 标识 (重连、刷新后不变，多副本共享同一个库)。
+# 试用开始时间和解锁到期时间存 SQLite；进程内按 client 做带 TTL 的缓存，
+# 每次 rerun 的检查只是一次内存查找。解锁码只保存 PBKDF2 哈希。
+ACCESS_DB = os.environ.get("ACCESS_DB") or os.path.join(os.path.expanduser("~/"), "template_access.db")
+
+FREE_PERIOD_SECONDS = 600
+ACCESS_DURATION_HOURS = 24
+CACHE_TTL_SECONDS = 30.0
+CACHE_MAX_ENTRIES = 10000
+MAX_UNLOCK_ATTEMPTS = 5  # 每个来源 (IP，取不到时为 client) 连续输错的上限，记在进程里，刷新页面不清零
+UNLOCK_COOLDOWN_SECONDS = 300
+# 试用已过期且解锁 (若有) 也已过期这么多天的记录每天清理一次；之后再来的浏览器按新试用处理
+ENTITLEMENT_RETENTION_DAYS = 30
+PRUNE_INTERVAL_SECONDS = 86400.0
+
+# 解锁码哈希，逗号分隔，格式 pbkdf2_sha256$迭代次数$盐$十六进制摘要；
+# 用 `python access.py hash <code>` 生成。默认值对应演示用的 vip24。
+DEFAULT_CODE_HASHES = "pbkdf2_sha256$200000$7adf9dbc687aedb9$90da30a76ad022a8cfe9ae571741dfbab710fc1e7aebf5e408ba5f65c2820872"
+UNLOCK_CODE_HASHES = os.environ.get("UNLOCK_CODE_HASHES", DEFAULT_CODE_HASHES)
+PBKDF2_ITERATIONS = 200000
+
+CLIENT_PARAM = "client"
+CLIENT_ID_RE = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entitlements ("
+    " client_id TEXT PRIMARY KEY, trial_started REAL NOT NULL, unlocked_until REAL DEFAULT 0)",
+    # 启动预加载和每日清理都按这两列过滤，有索引时只碰仍然有效/待删除的行
+    "CREATE INDEX IF NOT EXISTS entitlements_unlocked_until ON entitlements (unlocked_until)",
+    "CREATE INDEX IF NOT EXISTS entitlements_trial_started ON entitlements (trial_started)",
+)
+
+
+def hash_code(code, iterations=PBKDF2_ITERATIONS, salt=None):
+    salt = salt or secrets.token_hex(8)
+    digest = hashlib.pbkdf2_hmac("sha256", code.encode("utf-8"), salt.encode(), iterations).hex()
+    return f"pbkdf2_sha256${iterations}${salt}${digest}"
+
+def verify_code(code, hashes=UNLOCK_CODE_HASHES):
+    for entry in filter(None, (h.strip() for h in hashes.split(","))):
+        try:
+            algo, iterations, salt, digest = entry.split("$")
+        except ValueError:
+            continue
+        if algo != "pbkdf2_sha256":
+            continue
+        candidate = hashlib.pbkdf2_hmac("sha256", code.encode("utf-8"), salt.encode(), int(iterations)).hex()
+        if hmac.compare_digest(candidate, digest):
+            return True
+    return False
+
+
+class Entitlement:
+    def __init__(self, trial_started, unlocked_until=0.0):
+        self.trial_started = trial_started
+        self.unlocked_until = unlocked_until
+
+    # 状态按时间戳现算，缓存里的记录到点自然过期，不必等 TTL
+    def status(self, now):
+        if self.unlocked_until > now:
+            return "unlocked"
+        if now - self.trial_started < FREE_PERIOD_SECONDS:
+            return "trial"
+        return "expired"
+
+    def trial_left(self, now):
+        return max(0.0, self.trial_started + FREE_PERIOD_SECONDS - now)
+
+
+class AccessStore:
+    def __init__(self, db_file=ACCESS_DB, cache_ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.db_file = db_file
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        # _lock 只护内存 (缓存/计数器)，_db_lock 只护连接：一个新 client 等库的写锁时，缓存命中照常返回
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._cache = collections.OrderedDict()  # client_id -> (Entitlement, expires_at)
+        self._attempts = collections.OrderedDict()  # 来源 -> (连续失败次数, 锁定到期 monotonic 时间)
+        self.counters = {"hits": 0, "misses": 0, "refreshes": 0, "unlocks": 0, "db_errors": 0, "unlock_failures": 0, "unlock_blocked": 0, "pruned": 0}
+        self._next_prune = 0.0
+
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in SCHEMA:
+            self._conn.execute(stmt)
+        self._maybe_prune()
+        self._preload()
+
+    def _maybe_prune(self):
+        # 每个进程每天执行一次 (DELETE 本身是幂等的)；只在回库的路径上检查，缓存命中不受影响
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+        cutoff = time.time() - ENTITLEMENT_RETENTION_DAYS * 86400
+        try:
+            with self._db_lock:
+                pruned = self._conn.execute(
+                    "DELETE FROM entitlements WHERE trial_started < ? AND unlocked_until < ?", (cutoff, cutoff)
+                ).rowcount
+        except sqlite3.Error:
+            with self._lock:
+                self.counters["db_errors"] += 1
+            return
+        with self._lock:
+            self.counters["pruned"] += pruned
+
+    def _preload(self):
+        # 部署重启后大量会话同时重连：一次查询把仍然有效的授权装进缓存，避免逐个回库
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT client_id, trial_started, unlocked_until FROM entitlements "
+            "WHERE unlocked_until > ? OR trial_started > ? ORDER BY MAX(trial_started, unlocked_until) DESC LIMIT ?",
+            (now, now - FREE_PERIOD_SECONDS, self.max_entries),
+        ).fetchall()
+        for client_id, trial_started, unlocked_until in reversed(rows):
+            self._put(client_id, Entitlement(trial_started, unlocked_until))
+
+    def _put(self, client_id, entitlement):
+        # TTL 加抖动：同一时刻装入的条目不会在同一时刻一起过期回库
+        expires_at = time.monotonic() + self.cache_ttl * random.uniform(0.8, 1.2)
+        self._cache[client_id] = (entitlement, expires_at)
+        self._cache.move_to_end(client_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _load(self, client_id):
+        # 先只读点查 (重连的老 client 不碰写锁)；首次见到的 client 才写入并开始试用，
+        # INSERT OR IGNORE 让多副本并发时以先写入者为准
+        self._maybe_prune()
+        now = time.time()
+        select = "SELECT trial_started, unlocked_until FROM entitlements WHERE client_id=?"
+        try:
+            with self._db_lock:
+                row = self._conn.execute(select, (client_id,)).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO entitlements (client_id, trial_started) VALUES (?, ?)", (client_id, now)
+                    )
+                    row = self._conn.execute(select, (client_id,)).fetchone()
+        except sqlite3.Error:
+            # 库不可用时放行：沿用缓存里的旧记录，没有就按新试用处理，并记账
+            with self._lock:
+                self.counters["db_errors"] += 1
+                cached = self._cache.get(client_id)
+            return cached[0] if cached else Entitlement(now)
+        entitlement = Entitlement(*row)
+        with self._lock:
+            self._put(client_id, entitlement)
+        return entitlement
+
+    def get(self, client_id):
+        with self._lock:
+            cached = self._cache.get(client_id)
+            if cached is not None and time.monotonic() < cached[1]:
+                self.counters["hits"] += 1
+                return cached[0]
+            self.counters["misses"] += 1
+        return self._load(client_id)
+
+    def check(self, client_id):
+        now = time.time()
+        entitlement = self.get(client_id)
+        status = entitlement.status(now)
+        if status == "expired":
+            # 拒绝前回库确认一次：可能刚在另一个副本上解锁
+            with self._lock:
+                self.counters["refreshes"] += 1
+            entitlement = self._load(client_id)
+            status = entitlement.status(now)
+        return status, entitlement
+
+    def unlock(self, client_id, hours=ACCESS_DURATION_HOURS):
+        now = time.time()
+        until = now + hours * 3600
+        with self._db_lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO entitlements (client_id, trial_started, unlocked_until) VALUES (?, ?, ?) "
+                    "ON CONFLICT(client_id) DO UPDATE SET unlocked_until = MAX(unlocked_until, excluded.unlocked_until)",
+                    (client_id, now, until),
+                )
+                row = self._conn.execute(
+                    "SELECT trial_started, unlocked_until FROM entitlements WHERE client_id=?", (client_id,)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+        with self._lock:
+            if row is None:
+                self.counters["db_errors"] += 1
+                return None
+            self._put(client_id, Entitlement(*row))
+            self.counters["unlocks"] += 1
+        return until
+
+    # --- 解锁码尝试次数：锁定期内直接拒绝，不再为每次猜测跑 PBKDF2 ---
+    def unlock_allowed(self, source):
+        with self._lock:
+            entry = self._attempts.get(source)
+            if entry is not None and time.monotonic() < entry[1]:
+                self.counters["unlock_blocked"] += 1
+                return False
+        return True
+
+    def record_failure(self, source):
+        with self._lock:
+            self.counters["unlock_failures"] += 1
+            failures = self._attempts.pop(source, (0, 0.0))[0] + 1
+            locked_until = 0.0
+            if failures >= MAX_UNLOCK_ATTEMPTS:
+                failures, locked_until = 0, time.monotonic() + UNLOCK_COOLDOWN_SECONDS
+            self._attempts[source] = (failures, locked_until)
+            while len(self._attempts) > self.max_entries:
+                self._attempts.popitem(last=False)
+
+    def clear_failures(self, source):
+        with self._lock:
+            self._attempts.pop(source, None)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["cached"] = len(self._cache)
+        return stats
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+
+@st.cache_resource(show_spinner=False)
+def get_access_store():
+    store = AccessStore()
+    get_metrics().register_collector("access", store.snapshot)
+    return store
+
+def get_client_id():
+    client_id = st.query_params.get(CLIENT_PARAM)
+    if not client_id or not CLIENT_ID_RE.fullmatch(client_id):
+        client_id = secrets.token_urlsafe(16)
+        st.query_params[CLIENT_PARAM] = client_id
+    return client_id
+
+
+# --- 页面入口：试用中显示剩余时间；到期后显示解锁表单并停止渲染 ---
+def enforce_access(texts):
+    store = get_access_store()
+    client_id = get_client_id()
+    status, entitlement = store.check(client_id)
+    if status == "trial":
+        minutes = int(entitlement.trial_left(time.time()) // 60) + 1
+        st.caption(texts.format("trial_left", minutes=minutes))
+    if status != "expired":
+        return
+
+    st.warning(texts.format("trial_over", hours=ACCESS_DURATION_HOURS))
+    # 按 IP 限制尝试次数 (本机访问时取不到 IP，退回 client)；刷新页面或换 client 都不会清零
+    ip_address = getattr(st.context, "ip_address", None)
+    source = ip_address if isinstance(ip_address, str) and ip_address else client_id
+    with st.form("unlock_form"):
+        code = st.text_input(texts.get("unlock_code"), type="password")
+        submitted = st.form_submit_button(texts.get("unlock_btn"), type="primary")
+    if submitted:
+        if not store.unlock_allowed(source):
+            st.error(texts.get("unlock_wait"))
+        elif code and verify_code(code.strip()):
+            if store.unlock(client_id) is None:
+                st.error(texts.get("unlock_failed"))
+            else:
+                store.clear_failures(source)
+                st.rerun()
+        else:
+            store.record_failure(source)
+            st.error(texts.get("unlock_wrong"))
+    st.stop()
+
+
+# 生成解锁码哈希：python access.py hash <code>
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "hash":
+        sys.exit("usage: python access.py hash <code>")
+    print(hash_code(sys.argv[2]))
@@ -0,0 +1,76 @@
+import hmac
+import os
+
+import pandas as pd
+import streamlit as st
+
+from metrics import METRICS_DUMP_SECONDS, METRICS_FILE, get_metrics
+from stats import HISTORY_GRAINS, days_ago, get_tracker
+
+# ==========================================
+# 运维页 (隐藏入口: ?admin)
+# ==========================================
+# 口令取自环境变量 ADMIN_PASSCODE；未设置时整个页面关闭。
+ADMIN_PASSCODE = os.environ.get("ADMIN_PASSCODE", "")
+HISTORY_RANGES = {"30 days": 30, "90 days": 90, "1 year": 365, "2 years": 730}
+
+
+def check_admin_access():
+    if st.session_state.get("admin_ok"):
+        return True
+    if not ADMIN_PASSCODE:
+        st.error("Admin page is disabled. Set the ADMIN_PASSCODE environment variable to enable it.")
+        return False
+    code = st.text_input("Passcode", type="password", key="admin_code")
+    if code and hmac.compare_digest(code.encode(), ADMIN_PASSCODE.encode()):
+        st.session_state.admin_ok = True
+        st.rerun()
+    elif code:
+        st.error("Wrong passcode.")
+    return False
+
+def render_traffic_history(tracker):
+    # 读日表/周月汇总表 (一年日线约 365 行)，tracker 内有短 TTL 缓存
+    st.subheader("Traffic history")
+    col_grain, col_range = st.columns(2)
+    grain = col_grain.radio("Granularity", HISTORY_GRAINS, horizontal=True, key="history_grain")
+    label = col_range.radio("Range", list(HISTORY_RANGES), index=2, horizontal=True, key="history_range")
+    rows = tracker.read_history(grain, days_ago(HISTORY_RANGES[label]))
+    if not rows:
+        st.caption("No traffic recorded in this range.")
+        return
+    history = pd.DataFrame(rows, columns=["period", "PV", "UV"]).set_index("period")
+    st.line_chart(history)
+    if tracker.uv_mode == "hll":
+        st.caption("UV is a HyperLogLog estimate (about 1.6% standard error).")
+
+def render_admin_page():
+    st.title("🔧 Admin")
+    if not check_admin_access():
+        return
+
+    tracker = get_tracker()  # 同时确保统计子系统已注册计数器
+    metrics = get_metrics()
+
+    render_traffic_history(tracker)
+
+    st.subheader("Section render time (this process)")
+    summary = metrics.summary()
+    if summary:
+        st.dataframe(pd.DataFrame(summary), hide_index=True, use_container_width=True)
+    else:
+        st.caption("No samples yet.")
+
+    st.subheader("Counters")
+    for name, counters in metrics.collected().items():
+        st.caption(name)
+        st.dataframe(pd.DataFrame([counters]), hide_index=True, use_container_width=True)
+
+    st.subheader("Gauges")
+    for name, values in metrics.gauges().items():
+        st.caption(name)
+        st.dataframe(pd.DataFrame([values]), hide_index=True, use_container_width=True)
+
+    st.subheader("Plain-text metrics")
+    st.caption(f"Also written every {METRICS_DUMP_SECONDS:.0f}s to `{METRICS_FILE}`.")
+    st.code(metrics.render_text(), language="text")
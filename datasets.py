@@ -0,0 +1,124 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+# ==========================================
+# 数据集注册表：文件驱动 + 进程内只加载一次
+# ==========================================
+# 每个数据集对应 data/<name>.csv；若同名 .parquet 存在且不比 CSV 旧，则走 Parquet 快速路径。
+# 所有会话共享同一份只读 DataFrame；文件 mtime/大小变化时整体重载并原子替换。
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DATASET_NAMES = ("cocaine", "fentanyl", "oil", "oil_history", "countries")
+RELOAD_CHECK_SECONDS = 2.0
+
+# 文本列存的是 i18n 键 (如 role_primary_src)，渲染时再按语言翻译
+CSV_DTYPES = {
+    "cocaine": {"Country": str, "Role": str, "Rank": str},
+    "fentanyl": {"Country": str, "Role": str, "Details": str},
+    "oil": {"Country": str},
+    "oil_history": {"Country": str},  # 长表：Country × Year
+    # 国家维表 (tools/build_geo.py 生成)：ISO3 与本地地图 TopoJSON 的 id 一致；
+    # keep_default_na=False 避免 "NA" 之类的代码被读成缺失值
+    "countries": {"ISO3": str, "Country": str, "Aliases": str},
+}
+CSV_OPTIONS = {"countries": {"keep_default_na": False}}
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+logger = logging.getLogger(__name__)
+
+
+class Dataset:
+    def __init__(self, name, frame, version, source):
+        self.name = name
+        self.frame = frame
+        self.version = version  # (mtime_ns, size)，可直接拼进下游缓存键
+        self.source = source
+
+
+class DatasetRegistry:
+    def __init__(self, data_dir=DATA_DIR, check_interval=RELOAD_CHECK_SECONDS):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._next_check = {}
+
+    def _source(self, name):
+        csv_path = os.path.join(self.data_dir, f"{name}.csv")
+        parquet_path = os.path.join(self.data_dir, f"{name}.parquet")
+        if HAS_PARQUET and os.path.exists(parquet_path):
+            if not os.path.exists(csv_path) or os.stat(parquet_path).st_mtime_ns >= os.stat(csv_path).st_mtime_ns:
+                return parquet_path
+        return csv_path
+
+    def _load(self, name):
+        path = self._source(name)
+        info = os.stat(path)
+        if path.endswith(".parquet"):
+            frame = pd.read_parquet(path)
+        else:
+            frame = pd.read_csv(path, dtype=CSV_DTYPES.get(name), **CSV_OPTIONS.get(name, {}))
+        missing = set(CSV_DTYPES.get(name, {})) - set(frame.columns)
+        if missing:
+            raise ValueError(f"{path} is missing columns {sorted(missing)}")
+        return Dataset(name, frame, (info.st_mtime_ns, info.st_size), path)
+
+    def _is_stale(self, entry):
+        path = self._source(entry.name)
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return False  # 文件被临时移走时继续用旧数据
+        return path != entry.source or (info.st_mtime_ns, info.st_size) != entry.version
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        now = time.monotonic()
+        if entry is not None and now < self._next_check.get(name, 0.0):
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._load(name)  # 首次加载失败没有旧数据可用，直接抛出
+                self._entries[name] = entry
+            elif self._is_stale(entry):
+                # 新数据完整加载后再替换引用，读者要么看到旧版本，要么看到新版本；
+                # 文件拷到一半或格式有误时继续用旧数据，check_interval 后再试
+                try:
+                    entry = self._load(name)
+                except Exception:
+                    logger.exception("Reloading dataset %s failed; keeping version %s", name, entry.version)
+                else:
+                    self._entries[name] = entry
+            self._next_check[name] = now + self.check_interval
+        return entry
+
+
+@st.cache_resource(show_spinner=False)
+def get_registry():
+    return DatasetRegistry()
+
+def get_dataset(name):
+    return get_registry().get(name)
+
+
+# 生成 Parquet 快速路径：python datasets.py
+if __name__ == "__main__":
+    if not HAS_PARQUET:
+        sys.exit("pyarrow is not installed; cannot write Parquet files.")
+    for name in DATASET_NAMES:
+        csv_path = os.path.join(DATA_DIR, f"{name}.csv")
+        frame = pd.read_csv(csv_path, dtype=CSV_DTYPES.get(name), **CSV_OPTIONS.get(name, {}))
+        frame.to_parquet(os.path.join(DATA_DIR, f"{name}.parquet"), index=False)
+        print(f"{name}: {len(frame)} rows -> {name}.parquet")
@@ -0,0 +1,212 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from datasets import DATASET_NAMES, get_dataset
+from i18n import LANGS, get_catalog
+
+# ==========================================
+# 派生列 + 展示表：数据加载时一次性、向量化算好
+# ==========================================
+# 与语言无关的派生列每个数据版本只算一次；每种语言的地图 frame 和排好序/格式化好的
+# 表格 frame 在该语言第一次被访问时生成并缓存，之后渲染只按键取用。
+
+# 全球总量的估算系数 (样本国家之外的份额)
+RESERVES_WORLD_FACTOR = 1.2
+PRODUCTION_WORLD_FACTOR = 1.3
+
+TABLE_COLUMNS = {
+    "cocaine": ['Country', 'Role', 'Rank', 'Flow_Share'],
+    "fentanyl": ['Country', 'Role', 'Risk_Score'],
+    "reserves": ['Reserves_Rank', 'Country', 'Reserves_Billion_Barrels', 'Reserves_Share'],
+    "production": ['Production_Rank', 'Country', 'Production_Million_BPD', 'Production_Share'],
+}
+
+
+# 时间序列：指标列, 标签数值格式 (printf), 标签单位, 悬停数值格式 (d3)
+TIMELINE_SPECS = {
+    "reserves": ("Reserves_Billion_Barrels", "%.0f", " Bn", ".0f"),
+    "production": ("Production_Million_BPD", "%.1f", " M", ".1f"),
+}
+
+# 毒品 vs 石油对比图：横轴石油指标、纵轴毒品指标；所有组合共用一张按国家连接好的表
+OIL_METRICS = {"reserves": "Reserves_Billion_Barrels", "production": "Production_Million_BPD"}
+DRUG_METRICS = {"cocaine": "Flow_Share", "fentanyl": "Risk_Score"}
+HIGHLIGHT_ISO3 = "VEN"
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineView:
+    # values/labels 为 国家 × 年份 的二维数组，列顺序与 years 一致；
+    # labels 只含数值部分 (国名在图上由 texttemplate 拼接，不必每帧重复发送)
+    def __init__(self, countries, iso3, lat, lon, years, values, labels, value_format):
+        self.countries = countries
+        self.iso3 = iso3
+        self.lat = lat
+        self.lon = lon
+        self.years = years
+        self.values = values
+        self.labels = labels
+        self.value_format = value_format
+
+
+class ChartView:
+    def __init__(self, map_frame, table_frame):
+        self.map_frame = map_frame
+        self.table_frame = table_frame
+
+
+def _translate(frame, lang, columns):
+    # 按字典整列映射；字典里没有的键 (如 "-") 原样保留
+    texts = get_catalog(lang).texts
+    return frame.assign(**{col: frame[col].map(texts).fillna(frame[col]) for col in columns})
+
+# --- 国名 → ISO3：展示名和别名都按 casefold 建索引，地图按 ISO-3 代码匹配本地 TopoJSON ---
+def country_index(countries):
+    names = countries["Country"].str.casefold()
+    index = dict(zip(names, countries["ISO3"]))
+    for iso3, aliases in zip(countries["ISO3"], countries["Aliases"]):
+        for alias in filter(None, aliases.split("|")):
+            index.setdefault(alias.casefold(), iso3)
+    return index
+
+def attach_geo(frame, countries, index):
+    # 追加 ISO3 和标签坐标；查不到的国家保留在表格里，但地图上不着色也不标注
+    iso3 = frame["Country"].str.casefold().map(index)
+    unknown = frame.loc[iso3.isna(), "Country"].unique()
+    if len(unknown):
+        logger.warning("No ISO-3 code for %s; add them to data/countries.csv", ", ".join(unknown))
+    coords = countries.set_index("ISO3")[["lat", "lon"]]
+    return frame.assign(
+        ISO3=iso3,
+        lat=iso3.map(coords["lat"]),
+        lon=iso3.map(coords["lon"]),
+    )
+
+def derive_timeline(history, chart):
+    metric, label_fmt, unit, value_format = TIMELINE_SPECS[chart]
+    wide = history.pivot(index="Country", columns="Year", values=metric).sort_index(axis=1)
+    coords = history.groupby("Country")[["ISO3", "lat", "lon"]].first().loc[wide.index]
+    values = wide.to_numpy(dtype=float)
+    # 一次性格式化整张 国家×年份 矩阵；缺失年份标签为空，只显示国名
+    formatted = np.char.add(np.char.add("\n(", np.char.mod(label_fmt, values)), unit + ")")
+    labels = np.where(np.isnan(values), "", formatted)
+    return TimelineView(
+        list(wide.index), list(coords["ISO3"]), coords["lat"].to_numpy(), coords["lon"].to_numpy(),
+        [int(y) for y in wide.columns], values, labels, value_format,
+    )
+
+# --- 国家维度事实表：以 ISO3 为主键，把各数据集的指标向量化地连接到一起 ---
+def latest_oil(oil_history):
+    # 每个国家取时间序列里最新一年的石油指标
+    latest = oil_history.dropna(subset=["ISO3"]).sort_values("Year").groupby("ISO3").last()
+    return latest[list(OIL_METRICS.values())]
+
+def derive_country_facts(countries, cocaine, fentanyl, oil_history):
+    metrics = pd.concat(
+        [
+            cocaine.dropna(subset=["ISO3"]).set_index("ISO3")[[DRUG_METRICS["cocaine"]]],
+            fentanyl.dropna(subset=["ISO3"]).set_index("ISO3")[[DRUG_METRICS["fentanyl"]]],
+            latest_oil(oil_history),
+        ],
+        axis=1,
+    )
+    # 只保留至少出现在一个数据集里的国家；展示名和标签坐标统一取自维表
+    return countries.set_index("ISO3")[["Country", "lat", "lon"]].join(metrics, how="inner")
+
+def derive_comparison(facts):
+    # 石油表和毒品表里的国家都放上图；某个数据集里没有的国家该指标按 0 计。列名即图名，供图内切换直接取用
+    columns = {chart: facts[metric].fillna(0).to_numpy() for chart, metric in {**OIL_METRICS, **DRUG_METRICS}.items()}
+    return pd.DataFrame({"ISO3": facts.index, "Country": facts["Country"].to_numpy(), **columns, "highlight": facts.index == HIGHLIGHT_ISO3})
+
+def derive_base(cocaine, fentanyl, oil, oil_history, countries):
+    # 与语言无关的部分：地理坐标、标签、份额、时间序列，每个数据版本只算一次
+    base = {}
+    index = country_index(countries)
+    cocaine, fentanyl, oil, oil_history = (
+        attach_geo(frame, countries, index) for frame in (cocaine, fentanyl, oil, oil_history)
+    )
+
+    # --- 可卡因 ---
+    country = cocaine["Country"]
+    flow = cocaine["Flow_Share"]
+    base["cocaine"] = cocaine.assign(Label_Text=np.where(flow > 0, country + "\n(" + flow.astype(str) + "%)", country))
+
+    # --- 芬太尼 ---
+    base["fentanyl"] = fentanyl.assign(Label_Text=fentanyl["Country"] + "\n(Risk:" + fentanyl["Risk_Score"].astype(str) + ")")
+
+    # --- 石油 (储量/产量共用份额列，标签各自一份) ---
+    oil = oil.assign(
+        Reserves_Share=oil["Reserves_Billion_Barrels"] / (oil["Reserves_Billion_Barrels"].sum() * RESERVES_WORLD_FACTOR) * 100,
+        Production_Share=oil["Production_Million_BPD"] / (oil["Production_Million_BPD"].sum() * PRODUCTION_WORLD_FACTOR) * 100,
+    )
+    base["reserves"] = oil.assign(Label_Text=oil["Country"] + "\n(" + oil["Reserves_Billion_Barrels"].astype(str) + " Bn)")
+    base["production"] = oil.assign(Label_Text=oil["Country"] + "\n(" + oil["Production_Million_BPD"].astype(str) + " M)")
+
+    # --- 石油时间序列 ---
+    for chart in TIMELINE_SPECS:
+        base[("timeline", chart)] = derive_timeline(oil_history, chart)
+
+    # --- 跨数据集对比 (国家维度连接只在这里做一次) ---
+    base["comparison"] = derive_comparison(derive_country_facts(countries, cocaine, fentanyl, oil_history))
+    return base
+
+def derive_lang_views(base, lang):
+    # 单一语言的地图/表格 frame；某种语言第一次被访问时才生成
+    views = {}
+    df_c = _translate(base["cocaine"], lang, ["Role", "Rank"])
+    table_c = df_c[TABLE_COLUMNS["cocaine"]].sort_values(by='Flow_Share', ascending=False)
+    table_c = table_c.assign(Flow_Share=table_c['Flow_Share'].astype(str) + "%")
+    views["cocaine"] = ChartView(df_c, table_c)
+
+    df_f = _translate(base["fentanyl"], lang, ["Role", "Details"])
+    views["fentanyl"] = ChartView(df_f, df_f[TABLE_COLUMNS["fentanyl"]].sort_values(by='Risk_Score', ascending=False))
+
+    reserves, production = base["reserves"], base["production"]
+    views["reserves"] = ChartView(reserves, reserves[TABLE_COLUMNS["reserves"]].sort_values(by='Reserves_Rank'))
+    views["production"] = ChartView(production, production[TABLE_COLUMNS["production"]].sort_values(by='Production_Rank'))
+    return views
+
+def derive_views(cocaine, fentanyl, oil, oil_history, countries, langs=LANGS):
+    base = derive_base(cocaine, fentanyl, oil, oil_history, countries)
+    views = {key: value for key, value in base.items() if isinstance(key, tuple)}
+    for lang in langs:
+        for chart, view in derive_lang_views(base, lang).items():
+            views[(chart, lang)] = view
+    return views
+
+
+# 以各数据集的文件版本为缓存键：数据热更新后自动重算，旧版本随 max_entries 淘汰
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _cached_base(versions, _frames):
+    return derive_base(*_frames)
+
+@st.cache_resource(max_entries=2 * len(LANGS), show_spinner=False)
+def _cached_lang_views(versions, lang, _base):
+    return derive_lang_views(_base, lang)
+
+def get_base():
+    entries = [get_dataset(name) for name in DATASET_NAMES]
+    versions = tuple(entry.version for entry in entries)
+    return versions, _cached_base(versions, tuple(entry.frame for entry in entries))
+
+def get_view(chart, lang):
+    versions, base = get_base()
+    return versions, _cached_lang_views(versions, lang, base)[chart]
+
+def get_views(charts, lang):
+    versions, base = get_base()
+    views = _cached_lang_views(versions, lang, base)
+    return versions, tuple(views[chart] for chart in charts)
+
+def get_timelines(charts):
+    versions, base = get_base()
+    return versions, tuple(base[("timeline", chart)] for chart in charts)
+
+def get_comparison():
+    versions, base = get_base()
+    return versions, base["comparison"]
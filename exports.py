@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+import streamlit as st
+
+from datasets import HAS_PARQUET
+from derived import TABLE_COLUMNS, get_views
+from i18n import LANGS
+from metrics import get_metrics
+
+# ==========================================
+# 数据下载：每张排行表 × 语言 × 格式的文件字节，预先序列化
+# ==========================================
+# 每个数据版本、每种语言只序列化一次 (连同打包好的 ZIP)，缓存在进程里供所有会话复用；
+# 点下载按钮不触发 rerun，渲染时只按键取字节。导出的是表格的原始数值 (不带 % 等显示格式)，
+# 行序与页面表格一致，文本列按语言翻译。没有 pyarrow 时不提供 Parquet。
+EXPORT_TABLES = ("cocaine", "fentanyl", "reserves", "production")
+# 格式 -> (按钮文字, MIME, 扩展名)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv", "csv"),
+    "json": ("JSON", "application/json", "json"),
+}
+if HAS_PARQUET:
+    EXPORT_FORMATS["parquet"] = ("Parquet", "application/vnd.apache.parquet", "parquet")
+ZIP_MIME = "application/zip"
+
+
+class TableExports:
+    def __init__(self, files, archive):
+        self.files = files  # (表, 格式) -> 字节
+        self.archive = archive  # 全部表 × 全部格式的 ZIP
+
+
+def export_frame(chart, view):
+    # 与页面表格同样的行和顺序，但取地图 frame 里未格式化的数值列
+    return view.map_frame.loc[view.table_frame.index, TABLE_COLUMNS[chart]]
+
+def serialize(frame, fmt):
+    if fmt == "csv":
+        # 带 BOM：Excel 直接打开中文/西语也不乱码
+        return frame.to_csv(index=False).encode("utf-8-sig")
+    if fmt == "json":
+        return frame.to_json(orient="records", force_ascii=False).encode("utf-8")
+    if fmt == "parquet":
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    raise ValueError(f"unknown export format {fmt!r}")
+
+def file_name(chart, fmt, lang):
+    return f"{chart}_{lang}.{EXPORT_FORMATS[fmt][2]}"
+
+def archive_name(lang):
+    return f"global_insights_data_{lang}.zip"
+
+def build_exports(views, lang):
+    files = {}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for chart, view in zip(EXPORT_TABLES, views):
+            frame = export_frame(chart, view)
+            for fmt in EXPORT_FORMATS:
+                files[(chart, fmt)] = serialize(frame, fmt)
+                archive.writestr(file_name(chart, fmt, lang), files[(chart, fmt)])
+    return TableExports(files, buffer.getvalue())
+
+
+@st.cache_resource(max_entries=2 * len(LANGS), show_spinner=False)
+def _cached_exports(versions, lang, _views):
+    exports = build_exports(_views, lang)
+    get_metrics().set_gauge("export_bytes", f"zip:{lang}", len(exports.archive))
+    return exports
+
+def get_exports(lang):
+    versions, views = get_views(EXPORT_TABLES, lang)
+    return _cached_exports(versions, lang, views)
@@ -0,0 +1,436 @@
+import re
+
+import numpy as np
+import streamlit as st
+
+from metrics import get_metrics
+
+# ==========================================
+# 地图图表构建 + 进程级缓存
+# ==========================================
+# 每张图的输入只有 (模块, 语言, 数据) 这一小组组合，
+# 构建结果对所有会话都一样，因此放进进程级缓存，避免每次 rerun 重跑 Plotly Express。
+
+# plotly (约 0.2s 导入) 只在真正构图/序列化时才在函数内导入：缓存命中的渲染路径和冷启动的导入阶段都用不到它。
+FIGURE_CACHE_MAX_ENTRIES = 32  # 每类图最多 2 个模块 × 3 种语言，留足数据更新后的余量
+
+# 世界地图几何 (static/topojson/world_110m.json，由 tools/build_geo.py 生成) 随应用一起由
+# Streamlit 静态文件服务提供，浏览器不再去 cdn.plot.ly 拉取；所有 st.plotly_chart 都要带上这份 config。
+TOPOJSON_URL = "app/static/topojson/"
+PLOTLY_CONFIG = {"topojsonURL": TOPOJSON_URL}
+GEO_RESOLUTION = 110
+
+# 每张图发给浏览器的 JSON 字节上限 (tests/test_payload.py 据此断言，tools/check_payload.py 打印明细；手机端地图慢主要慢在体积)
+PAYLOAD_BUDGET_BYTES = {
+    "module:drugs": 6500,
+    "module:oil": 7500,
+    "timeline:oil": 24000,
+    "comparison": 4800,  # 含四种指标组合的全部数据
+}
+# 标签坐标只决定文字摆放位置，两位小数足够
+LABEL_COORD_DECIMALS = 2
+
+# 每张图的 (标题, 色条) 文案键，与 streamlit_app.py 中的调用一致 (检查/导出脚本按此构图)
+MAP_TEXT_KEYS = {
+    "cocaine": ("chart1_title", "chart1_label"),
+    "fentanyl": ("chart2_title", "chart2_label"),
+    "reserves": ("chart3_title", "chart3_label"),
+    "production": ("chart4_title", "chart4_label"),
+}
+TIMELINE_TEXT_KEYS = {
+    "reserves": ("chart3_timeline_title", "chart3_label"),
+    "production": ("chart4_timeline_title", "chart4_label"),
+}
+CONTROL_KEYS = ("anim_play", "anim_pause", "anim_year")
+COMPARISON_TITLE_KEY = "cmp_title"
+
+# 每个模块一张图，内含该模块所有视图 (地图 + 标签层 + 表格)；视图按钮在浏览器端切换可见的 trace，不回服务器
+MODULE_CHARTS = {"drugs": ("cocaine", "fentanyl"), "oil": ("reserves", "production")}
+VIEW_BUTTON_KEYS = {"cocaine": "opt_cocaine", "fentanyl": "opt_fentanyl", "reserves": "opt_reserves", "production": "opt_prod"}
+# 图内表格的列：列名 -> (表头文案键, 显示格式)
+TABLE_HEADERS = {
+    "cocaine": {"Country": ("col_country", None), "Role": ("col_role", None), "Rank": ("col_rank", None), "Flow_Share": ("col_share", None)},
+    "fentanyl": {"Country": ("col_country", None), "Role": ("col_role", None), "Risk_Score": ("col_risk", "{:.0f}")},
+    "reserves": {
+        "Reserves_Rank": ("col_rank", None), "Country": ("col_country", None),
+        "Reserves_Billion_Barrels": ("col_reserves", "{:.0f}"), "Reserves_Share": ("col_global_share", "{:.1f}%"),
+    },
+    "production": {
+        "Production_Rank": ("col_rank", None), "Country": ("col_country", None),
+        "Production_Million_BPD": ("col_prod", "{:.1f}"), "Production_Share": ("col_global_share", "{:.1f}%"),
+    },
+}
+MAP_COLUMN_WIDTH = 0.66  # 地图占图宽的比例，其余给表格
+# 各视图的色条水平放在地图下方，不与右侧表格重叠
+COLORBAR = dict(orientation="h", x=MAP_COLUMN_WIDTH / 2, xanchor="center", y=0.0, yanchor="top", len=0.5, thickness=12)
+HIGHLIGHT_COLOR = "#d62728"
+
+
+# --- 图内文案：按语言取好后作为缓存键的一部分 (均为可哈希的元组) ---
+def module_texts(module, get_txt):
+    # 每个视图：(标题, 色条标题, 表头, 按钮文字)
+    return tuple(
+        (
+            get_txt(MAP_TEXT_KEYS[chart][0]), get_txt(MAP_TEXT_KEYS[chart][1]),
+            tuple(get_txt(key) for key, _ in TABLE_HEADERS[chart].values()), get_txt(VIEW_BUTTON_KEYS[chart]),
+        )
+        for chart in MODULE_CHARTS[module]
+    )
+
+def timeline_texts(get_txt):
+    views = tuple(
+        (get_txt(title_key), get_txt(label_key), get_txt(VIEW_BUTTON_KEYS[chart]))
+        for chart, (title_key, label_key) in TIMELINE_TEXT_KEYS.items()
+    )
+    return views, tuple(get_txt(key) for key in CONTROL_KEYS)
+
+def comparison_texts(get_txt):
+    # 石油 × 毒品的每种组合一个选项：(石油图, 毒品图, 选项文字, 横轴标题, 纵轴标题)；轴标题沿用对应地图的色条文案
+    options = tuple(
+        (
+            oil_chart, drug_chart,
+            f"{get_txt(VIEW_BUTTON_KEYS[oil_chart])} × {get_txt(VIEW_BUTTON_KEYS[drug_chart])}",
+            get_txt(MAP_TEXT_KEYS[oil_chart][1]), get_txt(MAP_TEXT_KEYS[drug_chart][1]),
+        )
+        for oil_chart in MODULE_CHARTS["oil"] for drug_chart in MODULE_CHARTS["drugs"]
+    )
+    return get_txt(COMPARISON_TITLE_KEY), options
+
+CHART_SPECS = {
+    "cocaine": {
+        "color": "Flow_Share",
+        "hover_data": {"Role": True, "Rank": True, "Flow_Share": ":.0f%", "ISO3": False, "lat": False, "lon": False, "Label_Text": False},
+        "scale": "Oranges",
+        "height": 450,
+        "label_color": "#333333",
+    },
+    "fentanyl": {
+        "color": "Risk_Score",
+        "hover_data": {"Role": True, "Details": True, "ISO3": False, "lat": False, "lon": False, "Label_Text": False},
+        "scale": "Reds",
+        "height": 450,
+        "label_color": "#333333",
+    },
+    "reserves": {
+        "color": "Reserves_Billion_Barrels",
+        "hover_data": {"Reserves_Rank": True, "Reserves_Share": ":.1f%", "Production_Rank": True, "ISO3": False, "lat": False, "lon": False, "Label_Text": False},
+        "scale": "Viridis",
+        "height": 500,
+        "label_color": "#333333",
+    },
+    "production": {
+        "color": "Production_Million_BPD",
+        "hover_data": {"Production_Rank": True, "Production_Share": ":.1f%", "Reserves_Rank": True, "ISO3": False, "lat": False, "lon": False, "Label_Text": False},
+        "scale": "Plasma",
+        "height": 500,
+        "label_color": "#ffffff",
+    },
+}
+
+# --- 功能函数：在地图上添加文本标签 ---
+def add_map_labels(fig, df, lat_col='lat', lon_col='lon', text_col='Label_Text', color='#333333', size=9):
+    import plotly.graph_objects as go
+
+    fig.add_trace(go.Scattergeo(
+        lon=df[lon_col],
+        lat=df[lat_col],
+        text=df[text_col],
+        mode='text',
+        showlegend=False,
+        textfont=dict(size=size, color=color, family="Arial Black"),
+        hoverinfo='skip'
+    ))
+    return fig
+
+def build_map_figure(chart, df, title, color_label):
+    import plotly.express as px
+
+    spec = CHART_SPECS[chart]
+    fig = px.choropleth(
+        df, locations="ISO3", locationmode="ISO-3",
+        color=spec["color"],
+        hover_name="Country",
+        hover_data=spec["hover_data"],
+        color_continuous_scale=spec["scale"],
+        labels={spec["color"]: color_label},
+        title=title
+    )
+    fig = add_map_labels(fig, df, color=spec["label_color"])
+    fig.update_geos(fitbounds="locations", visible=True, resolution=GEO_RESOLUTION)
+    fig.update_layout(margin={"r":0,"t":30,"l":0,"b":0}, height=spec["height"])
+    return fig
+
+def _view_menu(labels, masks, titles):
+    # 视图切换按钮：只改 trace 可见性和标题，完全在浏览器端完成
+    return {
+        "type": "buttons", "direction": "right", "active": 0, "showactive": True,
+        "x": 0.0, "y": 1.0, "xanchor": "left", "yanchor": "bottom", "pad": {"b": 8},
+        "buttons": [
+            {"label": label, "method": "update", "args": [{"visible": mask}, {"title.text": title}]}
+            for label, mask, title in zip(labels, masks, titles)
+        ],
+    }
+
+def _visibility_masks(n_views, traces_per_view):
+    return [[j // traces_per_view == i for j in range(n_views * traces_per_view)] for i in range(n_views)]
+
+def _table_trace(frame, chart, headers):
+    import plotly.graph_objects as go
+
+    columns = TABLE_HEADERS[chart]
+    values = [[fmt.format(v) if fmt else str(v) for v in frame[col]] for col, (_, fmt) in columns.items()]
+    return go.Table(
+        columnwidth=[2 if col == "Country" else 1 for col in columns],
+        header=dict(values=list(headers), align="left", fill_color="#f8f9fa", font=dict(size=12, color="#111111")),
+        cells=dict(values=values, align="left", height=26, fill_color="#ffffff", line_color="#eeeeee", font=dict(size=12)),
+    )
+
+# --- 模块图：左侧地图 (每个视图一层着色 + 一层标签)，右侧联动表格，视图按钮切换 ---
+def build_module_figure(module, views, texts):
+    from plotly.subplots import make_subplots
+
+    charts = MODULE_CHARTS[module]
+    fig = make_subplots(
+        rows=1, cols=2, column_widths=[MAP_COLUMN_WIDTH, 1 - MAP_COLUMN_WIDTH], horizontal_spacing=0.02,
+        specs=[[{"type": "geo"}, {"type": "table"}]],
+    )
+    for i, (chart, view, (title, color_label, headers, _)) in enumerate(zip(charts, views, texts)):
+        spec = CHART_SPECS[chart]
+        choropleth, labels = build_map_figure(chart, view.map_frame, title, color_label).data
+        # px 把色阶放在共享的 coloraxis 上；这里每个视图各带自己的色阶和色条
+        choropleth.update(coloraxis=None, colorscale=spec["scale"], colorbar=dict(COLORBAR, title=color_label))
+        for trace, col in ((choropleth, 1), (labels, 1), (_table_trace(view.table_frame, chart, headers), 2)):
+            trace.visible = i == 0
+            fig.add_trace(trace, row=1, col=col)
+    titles = [title for title, _, _, _ in texts]
+    fig.update_geos(fitbounds="locations", visible=True, resolution=GEO_RESOLUTION)
+    fig.update_layout(
+        title=titles[0],
+        margin={"r":0,"t":80,"l":0,"b":50}, height=max(CHART_SPECS[chart]["height"] for chart in charts) + 50,
+        updatemenus=[_view_menu([button for _, _, _, button in texts], _visibility_masks(len(charts), 3), titles)],
+    )
+    return fig
+
+# --- 时间序列动画图：每年一帧，帧里只放随年份变化的 z 和标签文本 ---
+# 国家列表、坐标、色阶、标签里的国名等不变的部分只在底图里出现一次；拖动滑块/播放完全在浏览器端完成。
+# 储量/产量两个视图放在同一张图里 (每个视图一层着色 + 一层标签)，帧同时更新两者，切换视图不打断播放进度。
+def build_timeline_figure(timelines, texts):
+    import plotly.graph_objects as go
+
+    charts = tuple(TIMELINE_TEXT_KEYS)
+    view_texts, (play_label, pause_label, year_label) = texts
+    years = timelines[0].years
+    if any(timeline.years != years for timeline in timelines):
+        raise ValueError("timeline views must cover the same years")
+    last = len(years) - 1
+    data = []
+    for i, (chart, timeline, (title, color_label, _)) in enumerate(zip(charts, timelines, view_texts)):
+        spec = CHART_SPECS[chart]
+        data += [
+            go.Choropleth(
+                locations=timeline.iso3, locationmode="ISO-3",
+                text=timeline.countries,
+                z=timeline.values[:, last],
+                zmin=float(np.nanmin(timeline.values)), zmax=float(np.nanmax(timeline.values)),
+                colorscale=spec["scale"],
+                colorbar=dict(title=color_label),
+                hovertemplate="<b>%{text}</b><br>" + color_label + ": %{z:" + timeline.value_format + "}<extra></extra>",
+                visible=i == 0,
+            ),
+            go.Scattergeo(
+                lon=timeline.lon, lat=timeline.lat,
+                customdata=timeline.countries,
+                text=timeline.labels[:, last],
+                texttemplate="%{customdata}%{text}",
+                mode='text', showlegend=False,
+                textfont=dict(size=9, color=spec["label_color"], family="Arial Black"),
+                hoverinfo='skip',
+                visible=i == 0,
+            ),
+        ]
+    fig = go.Figure(
+        data=data,
+        frames=[
+            go.Frame(
+                name=str(year),
+                data=[
+                    trace
+                    for timeline in timelines
+                    for trace in (go.Choropleth(z=timeline.values[:, y]), go.Scattergeo(text=timeline.labels[:, y]))
+                ],
+                traces=list(range(len(data))),
+            )
+            for y, year in enumerate(years)
+        ],
+    )
+    frame_args = {"mode": "immediate", "frame": {"duration": 600, "redraw": True}, "transition": {"duration": 0}}
+    titles = [title for title, _, _ in view_texts]
+    fig.update_layout(
+        title=titles[0],
+        margin={"r":0,"t":80,"l":0,"b":0}, height=max(CHART_SPECS[chart]["height"] for chart in charts),
+        updatemenus=[
+            _view_menu([button for _, _, button in view_texts], _visibility_masks(len(charts), 2), titles),
+            {
+                "type": "buttons", "direction": "left", "showactive": False,
+                "x": 0.0, "y": 0.0, "xanchor": "left", "yanchor": "top", "pad": {"t": 40},
+                "buttons": [
+                    {"label": play_label, "method": "animate", "args": [None, dict(frame_args, fromcurrent=True)]},
+                    {"label": pause_label, "method": "animate", "args": [[None], {"mode": "immediate", "frame": {"duration": 0, "redraw": False}}]},
+                ],
+            },
+        ],
+        sliders=[{
+            "active": last,
+            "x": 0.15, "y": 0.0, "len": 0.85, "yanchor": "top", "pad": {"t": 30},
+            "currentvalue": {"prefix": year_label},
+            "steps": [
+                {"label": str(year), "method": "animate", "args": [[str(year)], frame_args]}
+                for year in years
+            ],
+        }],
+    )
+    fig.update_geos(fitbounds="locations", visible=True, resolution=GEO_RESOLUTION)
+    return fig
+
+# --- 毒品 vs 石油散点图：每个国家一个点，委内瑞拉单独一条 trace 高亮 ---
+# 四种指标组合放在一个下拉框里，切换时在浏览器端替换两条 trace 的 x/y、悬停模板和轴标题
+def build_comparison_figure(frame, texts):
+    import plotly.graph_objects as go
+
+    title, options = texts
+    others, highlight = frame[~frame["highlight"]], frame[frame["highlight"]]
+
+    def restyle(oil_chart, drug_chart, x_label, y_label):
+        hovertemplate = "<b>%{text}</b><br>" + x_label + ": %{x}<br>" + y_label + ": %{y}<extra></extra>"
+        return [
+            {
+                # 按钮参数里的数组原样写进 JSON：整数值用 int，避免 "303.0" 这类多余字符
+                "x": [_pack_numbers(others[oil_chart], None).tolist(), _pack_numbers(highlight[oil_chart], None).tolist()],
+                "y": [_pack_numbers(others[drug_chart], None).tolist(), _pack_numbers(highlight[drug_chart], None).tolist()],
+                "hovertemplate": [hovertemplate, hovertemplate],
+            },
+            {"xaxis.title.text": x_label, "yaxis.title.text": y_label},
+        ]
+
+    oil_chart, drug_chart, _, x_label, y_label = options[0]
+    traces, layout = restyle(oil_chart, drug_chart, x_label, y_label)
+    fig = go.Figure([
+        go.Scatter(
+            x=traces["x"][0], y=traces["y"][0], text=others["Country"], mode="markers+text",
+            textposition="top center", textfont=dict(size=10, color="#6b7280"),
+            marker=dict(size=10, color="#9ca3af"), hovertemplate=traces["hovertemplate"][0],
+        ),
+        go.Scatter(
+            x=traces["x"][1], y=traces["y"][1], text=highlight["Country"], mode="markers+text",
+            textposition="top center", textfont=dict(size=13, color=HIGHLIGHT_COLOR, family="Arial Black"),
+            marker=dict(size=18, color=HIGHLIGHT_COLOR, line=dict(width=2, color="#ffffff")), hovertemplate=traces["hovertemplate"][1],
+        ),
+    ])
+    fig.update_layout(
+        title=title, height=450, showlegend=False,
+        margin={"r":10,"t":80,"l":10,"b":10},
+        xaxis_title=x_label, yaxis_title=y_label,
+        updatemenus=[{
+            "type": "dropdown", "active": 0, "x": 0.0, "y": 1.0, "xanchor": "left", "yanchor": "bottom", "pad": {"b": 8},
+            "buttons": [
+                {"label": label, "method": "update", "args": restyle(oil, drug, x_text, y_text)}
+                for oil, drug, label, x_text, y_text in options
+            ],
+        }],
+    )
+    return fig
+
+# ------------------------------------------
+# 序列化前瘦身：只保留浏览器真正用到的数据
+# ------------------------------------------
+# 1) customdata 只留悬停模板引用到的列 (px 会把 hover_data 里隐藏的列也塞进去)；
+# 2) 数值按展示精度取整，整数列用最小整型、有显式格式的浮点列用 float32 打包；
+# 3) 主题模板只留本图用到的部分：色阶都由 CHART_SPECS 指定，模板里的默认色阶/色序列用不上。
+_CUSTOMDATA_REF = re.compile(r"customdata\[(\d+)\]")
+
+def _format_decimals(hovertemplate, ref):
+    # "%{customdata[1]:.1f%}" -> 1；模板里没有显式格式时返回 None
+    match = re.search(r"%\{" + re.escape(ref) + r":[^}]*?\.(\d+)f", hovertemplate or "")
+    return int(match.group(1)) if match else None
+
+def _pack_numbers(values, decimals):
+    values = np.asarray(values, dtype=float)
+    if decimals is not None:
+        values = values.round(decimals)
+    if values.size and np.isfinite(values).all() and (values == values.round()).all():
+        for dtype in (np.int8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= values.min() and values.max() <= info.max:
+                return values.astype(dtype)
+    return values.astype(np.float32) if decimals is not None else values
+
+def _slim_customdata(trace):
+    used = sorted({int(i) for i in _CUSTOMDATA_REF.findall(trace.hovertemplate or "")})
+    columns = np.asarray(trace.customdata, dtype=object)
+    if not used:
+        trace.customdata = None
+        return
+    remap = {old: new for new, old in enumerate(used)}
+    kept = []
+    for old in used:
+        column = columns[:, old]
+        decimals = _format_decimals(trace.hovertemplate, f"customdata[{old}]")
+        if decimals is not None:
+            column = [round(float(v), decimals) for v in column]
+        kept.append(column)
+    trace.customdata = np.column_stack(kept) if kept else None
+    trace.hovertemplate = _CUSTOMDATA_REF.sub(lambda m: f"customdata[{remap[int(m.group(1))]}]", trace.hovertemplate)
+
+def _slim_trace(trace, hovertemplate=None):
+    if trace.type == "choropleth" and trace.z is not None:
+        trace.z = _pack_numbers(trace.z, _format_decimals(hovertemplate or trace.hovertemplate, "z"))
+    if trace.type == "scatter" and trace.x is not None:
+        trace.x = _pack_numbers(trace.x, None)
+        trace.y = _pack_numbers(trace.y, None)
+    if trace.type == "scattergeo" and trace.lat is not None:
+        trace.lat = _pack_numbers(trace.lat, LABEL_COORD_DECIMALS)
+        trace.lon = _pack_numbers(trace.lon, LABEL_COORD_DECIMALS)
+
+def _slim_template(fig):
+    template = fig.layout.template
+    used_types = {trace.type for trace in fig.data}
+    template.data = {name: getattr(template.data, name) for name in used_types if getattr(template.data, name, None)}
+    template.layout.colorscale = None
+    template.layout.colorway = None
+    template.layout.coloraxis.colorscale = None
+
+def slim_figure(fig):
+    for trace in fig.data:
+        if trace.customdata is not None:
+            _slim_customdata(trace)
+        _slim_trace(trace)
+    # 帧里只有 z/text；z 的展示精度沿用底图对应 trace 的悬停模板
+    for frame in fig.frames:
+        for trace, index in zip(frame.data, frame.traces or range(len(frame.data))):
+            _slim_trace(trace, fig.data[index].hovertemplate)
+    _slim_template(fig)
+    return fig
+
+def payload_bytes(fig):
+    # 与 st.plotly_chart 发送的 spec 一致
+    import plotly.io as pio
+
+    return len(pio.to_json(fig, validate=False).encode("utf-8"))
+
+def _record_payload(name, lang, fig):
+    get_metrics().set_gauge("figure_payload_bytes", f"{name}/{lang}", payload_bytes(fig))
+    return fig
+
+# data_version (数据文件版本) 参与缓存键：数据一更新，旧条目自然失效；带下划线的数据参数不参与哈希。
+# 返回的 Figure 被所有会话共享，调用方只读不改 (st.plotly_chart 只做序列化)。
+@st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_module_figure(module, lang, data_version, _views, texts):
+    return _record_payload(f"module:{module}", lang, slim_figure(build_module_figure(module, _views, texts)))
+
+@st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_timeline_figure(lang, data_version, _timelines, texts):
+    return _record_payload("timeline:oil", lang, slim_figure(build_timeline_figure(_timelines, texts)))
+
+@st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_comparison_figure(lang, data_version, _frame, texts):
+    return _record_payload("comparison", lang, slim_figure(build_comparison_figure(_frame, texts)))
@@ -0,0 +1,52 @@
+import json
+import os
+
+import streamlit as st
+
+# ==========================================
+# 多语言文本 (locales/<lang>.json，按需加载)
+# ==========================================
+# 每种语言一个 JSON 文件，第一次用到时才读入并缓存在进程里；增加语言只需加文件，
+# 不影响启动和每次 rerun 的开销。缺失的键回退到默认语言 (英文)，再缺失则显示键名。
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+DEFAULT_LANG = "en"
+LANGS = ("en", "zh", "es")  # 语言切换按钮按此顺序轮换
+LANG_LABELS = {"en": "En", "zh": "中", "es": "Es"}
+
+
+class Catalog:
+    def __init__(self, lang, texts):
+        self.lang = lang
+        self.texts = texts
+        # 带 {占位符} 的模板预先绑定好 str.format，渲染时直接调用
+        self._templates = {
+            key: text.format for key, text in texts.items()
+            if isinstance(text, str) and "{" in text
+        }
+
+    def get(self, key):
+        return self.texts.get(key, key)
+
+    def format(self, key, **values):
+        template = self._templates.get(key)
+        return template(**values) if template else self.get(key)
+
+
+def _read_locale(lang):
+    with open(os.path.join(LOCALE_DIR, f"{lang}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+@st.cache_resource(show_spinner=False)
+def get_catalog(lang):
+    if lang not in LANGS:
+        lang = DEFAULT_LANG
+    texts = _read_locale(lang)
+    if lang != DEFAULT_LANG:
+        texts = {**get_catalog(DEFAULT_LANG).texts, **texts}
+    return Catalog(lang, texts)
+
+def get_text(lang, key):
+    return get_catalog(lang).get(key)
+
+def next_lang(lang):
+    return LANGS[(LANGS.index(lang) + 1) % len(LANGS)] if lang in LANGS else DEFAULT_LANG
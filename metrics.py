@@ -0,0 +1,155 @@
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import streamlit as st
+
+# ==========================================
+# 分区耗时 + 异常计数 (进程级)
+# ==========================================
+# 每个页面分区保留最近 SAMPLE_WINDOW 次耗时，按需计算 p50/p95/p99；
+# st.rerun()/st.stop() 属于 BaseException，不计入异常。
+SAMPLE_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+# 每个进程写自己的文件 ({pid} 换成进程号)，多副本时互不覆盖
+METRICS_FILE = os.environ.get("APP_METRICS_FILE", os.path.join(os.path.expanduser("~/"), "app_metrics.{pid}.prom")).replace("{pid}", str(os.getpid()))
+METRICS_DUMP_SECONDS = float(os.environ.get("APP_METRICS_DUMP_SECONDS", 15.0))
+
+
+class SectionStats:
+    def __init__(self):
+        self.samples = collections.deque(maxlen=SAMPLE_WINDOW)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sections = collections.defaultdict(SectionStats)
+        self._collectors = {}  # 其他子系统的计数器 (如访问统计的 dropped/failed)
+        self._gauges = collections.defaultdict(dict)  # 最新值类指标 (如每张图的发送字节数)
+        self.started_at = time.time()
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, failed)
+
+    def observe(self, name, seconds, failed=False):
+        with self._lock:
+            stats = self._sections[name]
+            stats.samples.append(seconds)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if failed:
+                stats.errors += 1
+
+    def register_collector(self, name, fn):
+        self._collectors[name] = fn
+
+    def set_gauge(self, name, key, value):
+        with self._lock:
+            self._gauges[name][key] = value
+
+    def gauges(self):
+        with self._lock:
+            return {name: dict(values) for name, values in self._gauges.items()}
+
+    def summary(self):
+        with self._lock:
+            items = [(name, sorted(s.samples), s.count, s.errors, s.total_seconds, s.max_seconds)
+                     for name, s in self._sections.items()]
+        rows = []
+        for name, samples, count, errors, total, max_seconds in sorted(items):
+            row = {"section": name, "count": count, "errors": errors}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_ms"] = _quantile(samples, q) * 1000
+            row["max_ms"] = max_seconds * 1000
+            row["mean_ms"] = total / count * 1000 if count else 0.0
+            rows.append(row)
+        return rows
+
+    def collected(self):
+        values = {}
+        for name, fn in self._collectors.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = {}
+        return values
+
+    # --- 纯文本导出 (Prometheus 文本格式)，供本机抓取 ---
+    def render_text(self):
+        pid = os.getpid()
+        lines = [
+            "# HELP app_section_seconds Render time per page section.",
+            "# TYPE app_section_seconds summary",
+        ]
+        summary = self.summary()
+        for row in summary:
+            labels = f'section="{row["section"]}",pid="{pid}"'
+            for q in QUANTILES:
+                lines.append(f'app_section_seconds{{{labels},quantile="{q}"}} {row[f"p{int(q * 100)}_ms"] / 1000:.6f}')
+            lines.append(f"app_section_seconds_count{{{labels}}} {row['count']}")
+        lines += ["# HELP app_section_errors_total Exceptions raised inside a page section.",
+                  "# TYPE app_section_errors_total counter"]
+        for row in summary:
+            lines.append(f'app_section_errors_total{{section="{row["section"]}",pid="{pid}"}} {row["errors"]}')
+        for name, counters in self.collected().items():
+            lines += [f"# TYPE app_{name}_total counter"]
+            for key, value in sorted(counters.items()):
+                lines.append(f'app_{name}_total{{kind="{key}",pid="{pid}"}} {value}')
+        for name, values in sorted(self.gauges().items()):
+            lines += [f"# TYPE app_{name} gauge"]
+            for key, value in sorted(values.items()):
+                lines.append(f'app_{name}{{key="{key}",pid="{pid}"}} {value}')
+        lines.append(f'app_process_start_time_seconds{{pid="{pid}"}} {self.started_at:.0f}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=METRICS_FILE):
+        # 先写临时文件再 rename，抓取方永远读到完整内容
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_text())
+        os.replace(tmp_path, path)
+
+    def start_dumper(self, path=METRICS_FILE, interval=METRICS_DUMP_SECONDS):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except OSError:
+                    pass
+
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    metrics = Metrics()
+    if METRICS_FILE:
+        metrics.start_dumper()
+    return metrics
+
+def timed_section(name):
+    return get_metrics().section(name)
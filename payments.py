@@ -0,0 +1,42 @@
+import io
+import os
+
+import streamlit as st
+
+# ==========================================
+# 打赏对话框的图片资源 (进程内缓存)
+# ==========================================
+# 收款码图片只从磁盘读一次并缩小到展示尺寸；演示用二维码在本地生成，按内容缓存，
+# 渲染路径上不再有磁盘 I/O 或第三方请求。PIL/qrcode 在第一次生成图片时才导入，不计入冷启动。
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+PAY_IMAGE_WIDTH = 360  # 对话框内约 180px 宽，按 2x 屏保留清晰度
+QR_BOX_SIZE = 6
+QR_CACHE_MAX_ENTRIES = 256
+
+
+@st.cache_resource(show_spinner=False)
+def load_pay_image(filename, width=PAY_IMAGE_WIDTH):
+    path = os.path.join(ASSET_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.thumbnail((width, width * 4))
+        buf = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(buf, format="PNG", optimize=True)
+        else:
+            img.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True)
+    return buf.getvalue()
+
+@st.cache_resource(max_entries=QR_CACHE_MAX_ENTRIES, show_spinner=False)
+def make_qr_png(data):
+    try:
+        import qrcode
+    except ImportError:
+        return None
+    img = qrcode.make(data, box_size=QR_BOX_SIZE, border=2)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
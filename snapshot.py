@@ -0,0 +1,276 @@
+import datetime
+import html
+import http.server
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+from i18n import LANG_LABELS, LANGS, get_catalog
+from stats import DB_FILE, SCHEMA, apply_pageviews, utc_today
+
+# ==========================================
+# 静态快照：流量高峰时的只读版本
+# ==========================================
+# `python snapshot.py export` 把每种语言的全部图表和表格预渲染成独立 HTML (static/snapshot/<lang>.html)，
+# 所有页面共用一份按版本命名的 plotly.js 和本地地图几何，可直接交给 CDN/反向代理缓存。
+# 读者不建立 Streamlit 会话、不跑脚本；页面里的一次 sendBeacon 计 PV，
+# `python snapshot.py serve` 在内存里累加，每 SNAPSHOT_FLUSH_SECONDS 一个事务写入统计库。
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SNAPSHOT_DIR = os.path.join(STATIC_DIR, "snapshot")
+SNAPSHOT_APP_URL = os.environ.get("SNAPSHOT_APP_URL", "/")  # 快照页上"打开交互版"的链接
+SNAPSHOT_FLUSH_SECONDS = 10.0
+SNAPSHOT_PORT = 8502
+HIT_PATH = "/snapshot/hit"
+
+# HTML 短缓存 (重新导出后几分钟内生效)；plotly.js 文件名带版本号，可以永久缓存
+CACHE_CONTROL = {
+    ".html": "public, max-age=300",
+    ".js": "public, max-age=31536000, immutable",
+    ".json": "public, max-age=86400",
+}
+
+# 页面结构与应用一致：(模块标题键, 模块, [说明文案键, ...])
+SECTIONS = (
+    ("exp1_title", "drugs", ("insight_cocaine", "insight_fentanyl")),
+    ("exp2_title", "oil", ("insight_reserves", "insight_prod")),
+)
+
+PAGE_STYLE = """
+body { font-family: Inter, -apple-system, Segoe UI, sans-serif; max-width: 1200px; margin: 0 auto; padding: 16px; color: #111; }
+nav { display: flex; gap: 12px; justify-content: flex-end; font-size: 0.9rem; }
+nav a, .live { color: #111; font-weight: 600; }
+.live { display: inline-block; margin: 8px 0 16px; padding: 8px 16px; border: 1px solid #e5e7eb; border-radius: 8px; text-decoration: none; }
+.chart { margin-bottom: 24px; }
+.insights { display: flex; flex-wrap: wrap; gap: 16px; }
+.insight { flex: 1 1 320px; color: #374151; }
+footer { color: #6b7280; font-size: 0.8rem; text-align: center; margin-top: 32px; }
+"""
+
+
+# --- 导出 ---
+def _markdown(text):
+    # 文案里只用到引用块和粗体
+    lines = [html.escape(re.sub(r"^>\s?", "", line)) for line in text.split("\n")]
+    return re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", "<br>".join(lines))
+
+def _figure_html(fig, div_id):
+    import plotly.io as pio
+    from figures import slim_figure
+
+    # 快照页没有 Streamlit 主题，换成普通白底模板再瘦身；地图几何从同站的 ../topojson/ 读取
+    fig.update_layout(template="plotly_white")
+    return pio.to_html(
+        slim_figure(fig), include_plotlyjs=False, full_html=False, div_id=div_id,
+        config={"topojsonURL": "../topojson/", "displaylogo": False, "responsive": True},
+    )
+
+def render_page(lang, plotly_js, data_date):
+    from derived import get_comparison, get_timelines, get_views
+    from figures import (
+        MODULE_CHARTS, TIMELINE_TEXT_KEYS, build_comparison_figure, build_module_figure,
+        build_timeline_figure, comparison_texts, module_texts, timeline_texts,
+    )
+
+    texts = get_catalog(lang)
+    get_txt = texts.get
+    nav = " · ".join(
+        f'<a href="{code}.html" hreflang="{code}">{LANG_LABELS[code]}</a>' for code in LANGS if code != lang
+    )
+    body = [
+        f"<nav>{nav}</nav>",
+        f"<h1>{html.escape(get_txt('main_title'))}</h1>",
+        f"<p>{html.escape(get_txt('main_subtitle'))}</p>",
+        f'<a class="live" href="{html.escape(SNAPSHOT_APP_URL)}">{html.escape(get_txt("snapshot_live_link"))}</a>',
+    ]
+
+    def insights(*keys):
+        return '<div class="insights">' + "".join(f'<p class="insight">{_markdown(get_txt(key))}</p>' for key in keys) + "</div>"
+
+    # 与应用相同的模块图：视图切换按钮在静态页里同样可用
+    for section_key, module, insight_keys in SECTIONS:
+        body.append(f"<h2>{html.escape(get_txt(section_key))}</h2>")
+        body.append(insights(*insight_keys))
+        _, views = get_views(MODULE_CHARTS[module], lang)
+        fig = build_module_figure(module, views, module_texts(module, get_txt))
+        body.append(f'<div class="chart">{_figure_html(fig, f"module-{module}")}</div>')
+    body.append(f"<p>{html.escape(get_txt('timeline_caption'))}</p>")
+    _, timelines = get_timelines(tuple(TIMELINE_TEXT_KEYS))
+    fig = build_timeline_figure(timelines, timeline_texts(get_txt))
+    body.append(f'<div class="chart">{_figure_html(fig, "timeline")}</div>')
+
+    body.append(f"<h2>{html.escape(get_txt('exp3_title'))}</h2>")
+    body.append(insights("cmp_insight"))
+    _, frame = get_comparison()
+    fig = build_comparison_figure(frame, comparison_texts(get_txt))
+    body.append(f'<div class="chart">{_figure_html(fig, "comparison")}</div>')
+    body.append(f"<p>{html.escape(get_txt('cmp_note'))}</p>")
+    body.append(f"<footer>{html.escape(texts.format('snapshot_note', date=data_date))}</footer>")
+
+    return (
+        f'<!DOCTYPE html><html lang="{lang}"><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f"<title>{html.escape(get_txt('main_title'))}</title><style>{PAGE_STYLE}</style>"
+        f'<script src="{plotly_js}"></script></head><body>'
+        + "\n".join(body)
+        # PV 信标：不阻塞渲染，失败也不影响阅读 (纯静态托管时 hit 会 404)
+        + '<script>navigator.sendBeacon && navigator.sendBeacon("hit");</script>'
+        + "</body></html>"
+    )
+
+def _write_atomic(path, content):
+    # 先写临时文件再替换：导出过程中正在被读取的旧页面始终完整
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def data_as_of():
+    # "数据截至" 取数据文件的最新修改日期 (UTC)，而不是导出日期：旧数据重新导出也不会显示成最新
+    from derived import get_base
+
+    versions, _ = get_base()
+    newest_ns = max(mtime_ns for mtime_ns, _ in versions)
+    return datetime.datetime.fromtimestamp(newest_ns / 1e9, datetime.timezone.utc).date().isoformat()
+
+def export(out_dir=SNAPSHOT_DIR):
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    os.makedirs(out_dir, exist_ok=True)
+    plotly_js = f"plotly-{plotly.__version__}.min.js"
+    if not os.path.exists(os.path.join(out_dir, plotly_js)):
+        _write_atomic(os.path.join(out_dir, plotly_js), get_plotlyjs())
+    data_date = data_as_of()
+    written = []
+    for lang in LANGS:
+        path = os.path.join(out_dir, f"{lang}.html")
+        _write_atomic(path, render_page(lang, plotly_js, data_date))
+        written.append(path)
+    # 入口页按浏览器语言跳转，默认第一种语言
+    redirect = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<meta http-equiv="refresh" content="0; url={LANGS[0]}.html"><script>'
+        f"var langs = {list(LANGS)!r}, lang = (navigator.language || '').slice(0, 2);"
+        "if (langs.indexOf(lang) >= 0) location.replace(lang + '.html');"
+        "</script></head><body></body></html>"
+    )
+    _write_atomic(os.path.join(out_dir, "index.html"), redirect)
+    return written
+
+
+# --- 服务：静态文件 + 批量计 PV ---
+class PageviewBuffer:
+    def __init__(self, db_file=DB_FILE, flush_interval=SNAPSHOT_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}  # date -> PV，内存里只按天累加，与访问量无关
+        self._stop = threading.Event()
+        self.counters = {"hits": 0, "flushed": 0, "failed_flushes": 0}
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for stmt in SCHEMA:
+            self._conn.execute(stmt)
+        self._thread = threading.Thread(target=self._run, name="snapshot-pv", daemon=True)
+        self._thread.start()
+
+    def add(self):
+        date = utc_today()
+        with self._lock:
+            self._pending[date] = self._pending.get(date, 0) + 1
+            self.counters["hits"] += 1
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                apply_pageviews(self._conn, pending)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            # 库暂时被锁：计数放回，下一轮再写
+            with self._lock:
+                for date, n in pending.items():
+                    self._pending[date] = self._pending.get(date, 0) + n
+                self.counters["failed_flushes"] += 1
+            return
+        with self._lock:
+            self.counters["flushed"] += sum(pending.values())
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+        self._conn.close()
+
+
+class SnapshotHandler(http.server.SimpleHTTPRequestHandler):
+    pageviews = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=STATIC_DIR, **kwargs)
+
+    def do_GET(self):
+        if self.path in ("/", "/snapshot"):
+            self.send_response(302)
+            self.send_header("Location", "/snapshot/")
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def do_POST(self):
+        if self.path != HIT_PATH:
+            self.send_error(404)
+            return
+        self.pageviews.add()
+        self.send_response(204)
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+    def end_headers(self):
+        ext = os.path.splitext(self.path.split("?", 1)[0])[1] or ".html"
+        if self.command in ("GET", "HEAD") and ext in CACHE_CONTROL:
+            self.send_header("Cache-Control", CACHE_CONTROL[ext])
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass  # 高峰时逐请求写日志本身就是开销
+
+
+def serve(port=SNAPSHOT_PORT):
+    pageviews = PageviewBuffer()
+    SnapshotHandler.pageviews = pageviews
+    server = http.server.ThreadingHTTPServer(("", port), SnapshotHandler)
+    print(f"serving {SNAPSHOT_DIR} on http://localhost:{port}/snapshot/ (PV -> {DB_FILE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pageviews.close()
+        print(f"snapshot page views: {pageviews.counters}")
+
+
+# python snapshot.py export          预渲染全部语言的快照页
+# python snapshot.py serve [port]    提供快照页并批量计 PV
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "export":
+        for path in export():
+            print(f"wrote {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    elif command == "serve":
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else SNAPSHOT_PORT)
+    else:
+        sys.exit("usage: python snapshot.py export | serve [port]")
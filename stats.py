@@ -0,0 +1,610 @@
+import atexit
+import datetime
+import glob
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import streamlit as st
+
+from hll import HyperLogLog
+from metrics import get_metrics
+
+# ==========================================
+# 访问统计：写后批量落库 (write-behind)
+# ==========================================
+# 进程内只建一次表；写连接归后台线程，读连接单独一个 (WAL 下读不等写)。
+# 会话只往内存队列里投事件，由后台线程按批次在单个事务里写入。
+DB_DIR = os.path.expanduser("~/")
+DB_FILE = os.environ.get("VISIT_STATS_DB") or os.path.join(DB_DIR, "template_visit_stats.db")
+
+# 存储模式：sqlite = 各进程直接批量写同一个库 (单机单进程足够)；
+# sharded = 每个进程只追加写自己的分片日志，定期压实进库 (多副本时写入互不加锁)
+STATS_MODE = os.environ.get("VISIT_STATS_MODE", "sqlite")
+SHARD_DIR = os.environ.get("VISIT_STATS_SHARD_DIR") or DB_FILE + ".shards"
+SHARD_ROTATE_SECONDS = 300.0
+SHARD_CLOSE_GRACE_SECONDS = 60.0  # 轮换后再等这么久，确认写入方已换到新文件
+COMPACT_INTERVAL_SECONDS = 10.0
+
+# 去重访客计数：exact = visitors 表逐人记录 (小规模部署)；
+# hll = 每天一个 HyperLogLog 草图 (约 4 KB)，visitors 表不再增长，磁盘/内存/查询开销有上限
+UV_MODE = os.environ.get("VISIT_STATS_UV_MODE", "exact")
+VISITOR_RETENTION_DAYS = 30  # hll 模式下旧的逐人记录保留天数 (之后由草图代表)
+SKETCH_RETENTION_DAYS = 400  # 日草图保留天数；全部时间的草图单独保存，不受影响
+
+FLUSH_INTERVAL_SECONDS = 1.0
+MAX_QUEUE_SIZE = 10000
+MAX_BATCH_SIZE = 500
+COUNTS_TTL_SECONDS = 5.0
+HISTORY_TTL_SECONDS = 30.0  # 运维页历史曲线的进程内缓存
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS daily_traffic (date TEXT PRIMARY KEY, pv_count INTEGER DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS visitors (visitor_id TEXT PRIMARY KEY, last_visit_date TEXT)",
+    # 维护式计数器：与访客 upsert 同一事务更新，读取时不再 COUNT(*) 扫表
+    "CREATE TABLE IF NOT EXISTS daily_uv (date TEXT PRIMARY KEY, uv_count INTEGER DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS uv_totals (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER DEFAULT 0)",
+    # 分片模式：每个分片已合并到的字节偏移，与合并结果同一事务提交，保证每条事件只计一次
+    "CREATE TABLE IF NOT EXISTS shard_offsets (shard TEXT PRIMARY KEY, offset INTEGER NOT NULL)",
+    # hll 模式：每日草图 + 全部时间草图；daily_uv/uv_totals 同步写入估计值，读取路径不变
+    "CREATE TABLE IF NOT EXISTS daily_hll (date TEXT PRIMARY KEY, sketch BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS hll_totals (id INTEGER PRIMARY KEY CHECK (id = 1), sketch BLOB NOT NULL)",
+    # 周/月汇总：与日表同一事务增量更新；period 为周一/月初的日期
+    "CREATE TABLE IF NOT EXISTS traffic_rollups ("
+    " grain TEXT NOT NULL, period TEXT NOT NULL, pv INTEGER DEFAULT 0, uv INTEGER DEFAULT 0,"
+    " PRIMARY KEY (grain, period))",
+    "CREATE TABLE IF NOT EXISTS rollup_hll ("
+    " grain TEXT NOT NULL, period TEXT NOT NULL, sketch BLOB NOT NULL, PRIMARY KEY (grain, period))",
+)
+
+logger = logging.getLogger(__name__)
+
+def utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+def days_ago(days, today=None):
+    today = datetime.date.fromisoformat(today or utc_today())
+    return (today - datetime.timedelta(days=days)).isoformat()
+
+def week_start(date):
+    day = datetime.date.fromisoformat(date)
+    return (day - datetime.timedelta(days=day.weekday())).isoformat()
+
+def month_start(date):
+    return date[:7] + "-01"
+
+ROLLUP_GRAINS = {"week": week_start, "month": month_start}
+HISTORY_GRAINS = ("day",) + tuple(ROLLUP_GRAINS)
+
+def _periods(date):
+    return [(grain, start(date)) for grain, start in ROLLUP_GRAINS.items()]
+
+def apply_events(conn, batch, uv_mode=UV_MODE):
+    # 把一批 (visitor_id, date) 事件合并进规范表；调用方负责事务
+    pv_by_date = {}
+    for _, date in batch:
+        pv_by_date[date] = pv_by_date.get(date, 0) + 1
+    apply_pageviews(conn, pv_by_date)
+    if uv_mode == "hll":
+        _apply_sketches(conn, batch)
+    else:
+        _apply_visitors(conn, batch)
+
+def apply_pageviews(conn, pv_by_date):
+    # 只加 PV (日表 + 周/月汇总)；静态快照的访问没有访客 ID，只走这一步
+    conn.executemany(
+        "INSERT INTO daily_traffic (date, pv_count) VALUES (?, ?) "
+        "ON CONFLICT(date) DO UPDATE SET pv_count = pv_count + excluded.pv_count",
+        pv_by_date.items(),
+    )
+    pv_by_period = {}
+    for date, n in pv_by_date.items():
+        for key in _periods(date):
+            pv_by_period[key] = pv_by_period.get(key, 0) + n
+    conn.executemany(
+        "INSERT INTO traffic_rollups (grain, period, pv) VALUES (?, ?, ?) "
+        "ON CONFLICT(grain, period) DO UPDATE SET pv = pv + excluded.pv",
+        [(grain, period, n) for (grain, period), n in pv_by_period.items()],
+    )
+
+def _apply_visitors(conn, batch):
+    # 每个访客在某天第一次出现时，daily_uv 当天 +1；全新访客 uv_totals +1；
+    # 周/月同理：上次访问不在同一周/月即计入 (last_visit_date 就是上次访问日)
+    new_visitors = 0
+    uv_by_date = {}
+    uv_by_period = {}
+    latest = dict(batch)  # 同批内同一访客只保留最后一天
+    seen = {}
+    for vid, date in batch:
+        prev = seen.get(vid)
+        if prev is None:
+            row = conn.execute("SELECT last_visit_date FROM visitors WHERE visitor_id=?", (vid,)).fetchone()
+            if row is None:
+                new_visitors += 1
+            prev = row[0] if row else None
+        if prev != date:
+            uv_by_date[date] = uv_by_date.get(date, 0) + 1
+            prev_periods = _periods(prev) if prev else ()
+            for key in _periods(date):
+                if key not in prev_periods:
+                    uv_by_period[key] = uv_by_period.get(key, 0) + 1
+        seen[vid] = date
+    conn.executemany(
+        "INSERT OR REPLACE INTO visitors (visitor_id, last_visit_date) VALUES (?, ?)",
+        latest.items(),
+    )
+    conn.executemany(
+        "INSERT INTO daily_uv (date, uv_count) VALUES (?, ?) "
+        "ON CONFLICT(date) DO UPDATE SET uv_count = uv_count + excluded.uv_count",
+        uv_by_date.items(),
+    )
+    conn.executemany(
+        "INSERT INTO traffic_rollups (grain, period, uv) VALUES (?, ?, ?) "
+        "ON CONFLICT(grain, period) DO UPDATE SET uv = uv + excluded.uv",
+        [(grain, period, n) for (grain, period), n in uv_by_period.items()],
+    )
+    if new_visitors:
+        conn.execute(
+            "INSERT INTO uv_totals (id, total) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET total = total + excluded.total",
+            (new_visitors,),
+        )
+
+
+def _load_sketch(conn, table, key_column, key):
+    row = conn.execute(f"SELECT sketch FROM {table} WHERE {key_column}=?", (key,)).fetchone()
+    return HyperLogLog(row[0]) if row else HyperLogLog()
+
+def _apply_sketches(conn, batch):
+    # 按天把访客并入当天草图，再并入周/月草图和全部时间草图；计数列写入估计值
+    ids_by_date = {}
+    for vid, date in batch:
+        ids_by_date.setdefault(date, set()).add(vid)
+    total = _load_sketch(conn, "hll_totals", "id", 1)
+    ids_by_period = {}
+    for date, ids in ids_by_date.items():
+        sketch = _load_sketch(conn, "daily_hll", "date", date).add_many(ids)
+        conn.execute("INSERT OR REPLACE INTO daily_hll (date, sketch) VALUES (?, ?)", (date, sketch.to_bytes()))
+        conn.execute("INSERT OR REPLACE INTO daily_uv (date, uv_count) VALUES (?, ?)", (date, sketch.estimate()))
+        total.add_many(ids)
+        for key in _periods(date):
+            ids_by_period.setdefault(key, set()).update(ids)
+    for (grain, period), ids in ids_by_period.items():
+        row = conn.execute("SELECT sketch FROM rollup_hll WHERE grain=? AND period=?", (grain, period)).fetchone()
+        sketch = HyperLogLog(row[0] if row else None).add_many(ids)
+        _save_rollup_sketch(conn, grain, period, sketch)
+    conn.execute("INSERT OR REPLACE INTO hll_totals (id, sketch) VALUES (1, ?)", (total.to_bytes(),))
+    conn.execute("INSERT OR REPLACE INTO uv_totals (id, total) VALUES (1, ?)", (total.estimate(),))
+
+def _save_rollup_sketch(conn, grain, period, sketch):
+    conn.execute("INSERT OR REPLACE INTO rollup_hll (grain, period, sketch) VALUES (?, ?, ?)",
+                 (grain, period, sketch.to_bytes()))
+    conn.execute(
+        "INSERT INTO traffic_rollups (grain, period, uv) VALUES (?, ?, ?) "
+        "ON CONFLICT(grain, period) DO UPDATE SET uv = excluded.uv",
+        (grain, period, sketch.estimate()),
+    )
+
+def backfill_counters(conn):
+    # 旧库升级：计数器表为空时，从 visitors 表一次性回填 (仅启动时扫描一次)；
+    # 检查放在事务里，多个进程同时启动时只有第一个回填
+    if conn.execute("SELECT 1 FROM uv_totals WHERE id = 1").fetchone():
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO daily_uv (date, uv_count) "
+        "SELECT last_visit_date, COUNT(*) FROM visitors GROUP BY last_visit_date"
+    )
+    conn.execute("INSERT INTO uv_totals (id, total) SELECT 1, COUNT(*) FROM visitors")
+
+def backfill_sketches(conn, chunk_size=10000):
+    # 从 exact 切换到 hll 时：把已有的逐人记录灌进草图 (分块读取，内存有上限)；只在没有全部时间草图时执行
+    if conn.execute("SELECT 1 FROM hll_totals WHERE id = 1").fetchone():
+        return
+    total = HyperLogLog()
+    daily = {}
+    cursor = conn.execute("SELECT visitor_id, last_visit_date FROM visitors")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        total.add_many(vid for vid, _ in rows)
+        by_date = {}
+        for vid, date in rows:
+            by_date.setdefault(date, []).append(vid)
+        for date, ids in by_date.items():
+            daily.setdefault(date, HyperLogLog()).add_many(ids)
+    conn.executemany(
+        "INSERT OR REPLACE INTO daily_hll (date, sketch) VALUES (?, ?)",
+        [(date, sketch.to_bytes()) for date, sketch in daily.items()],
+    )
+    # 当前周/月的草图也要就位，否则切换后第一批事件会用不完整的草图覆盖 exact 模式下的周/月 UV
+    periods = {}
+    for date, sketch in daily.items():
+        for key in _periods(date):
+            periods.setdefault(key, HyperLogLog()).merge(sketch)
+    for (grain, period), sketch in periods.items():
+        conn.execute("INSERT OR REPLACE INTO rollup_hll (grain, period, sketch) VALUES (?, ?, ?)",
+                     (grain, period, sketch.to_bytes()))
+    conn.execute("INSERT OR REPLACE INTO hll_totals (id, sketch) VALUES (1, ?)", (total.to_bytes(),))
+
+def backfill_rollups(conn, uv_mode=UV_MODE):
+    # 旧库升级：汇总表为空时从日表一次性回填。
+    # 只有最后访问日可用，所以较早周期的 UV 是下限；当前周/月恰好等于真实值
+    if conn.execute("SELECT 1 FROM traffic_rollups LIMIT 1").fetchone():
+        return
+    totals = {}
+    for date, pv in conn.execute("SELECT date, pv_count FROM daily_traffic").fetchall():
+        for key in _periods(date):
+            totals.setdefault(key, [0, 0])[0] += pv
+    if uv_mode == "hll":
+        sketches = {}
+        for date, blob in conn.execute("SELECT date, sketch FROM daily_hll").fetchall():
+            for key in _periods(date):
+                sketches.setdefault(key, HyperLogLog()).merge(HyperLogLog(blob))
+        for (grain, period), sketch in sketches.items():
+            totals.setdefault((grain, period), [0, 0])[1] = sketch.estimate()
+            conn.execute("INSERT OR REPLACE INTO rollup_hll (grain, period, sketch) VALUES (?, ?, ?)",
+                         (grain, period, sketch.to_bytes()))
+    else:
+        for date, n in conn.execute("SELECT last_visit_date, COUNT(*) FROM visitors GROUP BY last_visit_date").fetchall():
+            for key in _periods(date):
+                totals.setdefault(key, [0, 0])[1] += n
+    conn.executemany(
+        "INSERT INTO traffic_rollups (grain, period, pv, uv) VALUES (?, ?, ?, ?)",
+        [(grain, period, pv, uv) for (grain, period), (pv, uv) in totals.items()],
+    )
+
+def prune_history(conn, today=None, visitor_days=VISITOR_RETENTION_DAYS, sketch_days=SKETCH_RETENTION_DAYS):
+    # hll 模式的保留策略：旧的逐人记录和过期日/周/月草图删除，汇总计数 (daily_uv/traffic_rollups/uv_totals/hll_totals) 保留
+    cutoff = days_ago(sketch_days, today)
+    visitors = conn.execute("DELETE FROM visitors WHERE last_visit_date < ?", (days_ago(visitor_days, today),)).rowcount
+    sketches = conn.execute("DELETE FROM daily_hll WHERE date < ?", (cutoff,)).rowcount
+    sketches += conn.execute("DELETE FROM rollup_hll WHERE period < ?", (cutoff,)).rowcount
+    return visitors, sketches
+
+def read_history(conn, grain, since):
+    # 按粒度读 [since, 今天] 的 (周期, PV, UV)：一年的日线约 365 行，周线 53 行，月线 12 行
+    if grain == "day":
+        return conn.execute(
+            "SELECT t.date, t.pv_count, COALESCE(u.uv_count, 0) FROM daily_traffic t "
+            "LEFT JOIN daily_uv u ON u.date = t.date WHERE t.date >= ? ORDER BY t.date",
+            (since,),
+        ).fetchall()
+    return conn.execute(
+        "SELECT period, pv, uv FROM traffic_rollups WHERE grain=? AND period >= ? ORDER BY period",
+        (grain, ROLLUP_GRAINS[grain](since)),
+    ).fetchall()
+
+
+class VisitTracker:
+    def __init__(self, db_file=DB_FILE, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 max_queue_size=MAX_QUEUE_SIZE, max_batch_size=MAX_BATCH_SIZE,
+                 counts_ttl=COUNTS_TTL_SECONDS, uv_mode=UV_MODE):
+        self.db_file = db_file
+        self.uv_mode = uv_mode
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.counts_ttl = counts_ttl
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # 三把锁各管各的：计数器锁只护字典、从不跨 SQLite I/O，所以 record_visit 永远不会等库；
+        # 写锁串行化写连接上的事务 (含 BEGIN IMMEDIATE 的忙等)；读锁只护读连接
+        self._counters_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._stop = threading.Event()
+        # 计数器：丢弃 (队列满)、写失败、读失败都单独记账，不再吞成 0
+        self.counters = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "read_errors": 0, "batches": 0, "pruned": 0}
+        self._pruned_on = None
+        self._last_counts = None
+        self._counts_cache = (None, None, 0.0)  # (date, counts, expires_at)
+        self._history_cache = {}  # (grain, since) -> (rows, expires_at)
+
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in SCHEMA:
+            self._conn.execute(stmt)
+        self._read_conn = sqlite3.connect(db_file, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._read_conn.execute("PRAGMA query_only=ON")
+        self._transaction(backfill_counters)
+        if self.uv_mode == "hll":
+            self._transaction(backfill_sketches)
+        self._transaction(backfill_rollups, self.uv_mode)
+        self._maybe_prune()
+
+        self._thread = threading.Thread(target=self._run, name="visit-tracker", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _transaction(self, fn, *args):
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn, *args)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _maybe_prune(self):
+        # hll 模式每天执行一次保留策略 (每个进程各自判断，DELETE 本身是幂等的)
+        today = utc_today()
+        if self.uv_mode != "hll" or self._pruned_on == today:
+            return
+        try:
+            visitors, sketches = self._transaction(prune_history, today)
+        except sqlite3.Error:
+            return
+        self._pruned_on = today
+        self._bump("pruned", visitors + sketches)
+
+    # --- 写入路径：只入队，不碰数据库 ---
+    def record_visit(self, visitor_id, date=None):
+        event = (visitor_id, date or utc_today())
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("queued")
+        return True
+
+    def _bump(self, name, n=1):
+        with self._counters_lock:
+            self.counters[name] += n
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            self._transaction(apply_events, batch, self.uv_mode)
+        except sqlite3.Error:
+            self._bump("failed", len(batch))
+            return
+        except Exception:
+            # 其他异常 (如损坏的草图) 也只丢这一批，写线程不能因此退出
+            logger.exception("failed to write %d visit events", len(batch))
+            self._bump("failed", len(batch))
+            return
+        with self._counters_lock:
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+        self._maybe_prune()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write_batch(self._drain(first))
+
+    def flush(self):
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._write_batch(self._drain(first))
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+        self._close_connections()
+
+    def _close_connections(self):
+        with self._write_lock:
+            self._conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+    # --- 读取路径：走只读连接，不等写锁 ---
+    def read_counts(self, date=None):
+        # 两次主键点查 + 短 TTL 内存缓存：成本与访客总数无关
+        date = date or utc_today()
+        cached_date, counts, expires_at = self._counts_cache
+        if cached_date == date and time.monotonic() < expires_at:
+            return counts
+        try:
+            with self._read_lock:
+                row = self._read_conn.execute("SELECT uv_count FROM daily_uv WHERE date=?", (date,)).fetchone()
+                total = self._read_conn.execute("SELECT total FROM uv_totals WHERE id = 1").fetchone()
+        except sqlite3.Error:
+            # 读失败时沿用上一次成功的结果 (首次失败为 None)，并记账
+            self._bump("read_errors")
+            return self._last_counts
+        self._last_counts = (row[0] if row else 0, total[0] if total else 0)
+        self._counts_cache = (date, self._last_counts, time.monotonic() + self.counts_ttl)
+        return self._last_counts
+
+    def read_history(self, grain, since):
+        # 运维页的 PV/UV 曲线：读预聚合表，短 TTL 缓存让反复查看不回库
+        key = (grain, since)
+        cached = self._history_cache.get(key)
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        try:
+            with self._read_lock:
+                rows = read_history(self._read_conn, grain, since)
+        except sqlite3.Error:
+            self._bump("read_errors")
+            return cached[0] if cached else []
+        self._history_cache[key] = (rows, time.monotonic() + HISTORY_TTL_SECONDS)
+        return rows
+
+    def snapshot(self):
+        with self._counters_lock:
+            stats = dict(self.counters)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+# ------------------------------------------
+# 分片模式：进程内追加写日志，压实时合并进规范表
+# ------------------------------------------
+# 分片文件名 <主机>-<pid>-<创建时间>.log，每行 "日期\t访客ID"；每批事件一次 write 追加。
+# 写入方每 SHARD_ROTATE_SECONDS 换新文件，旧文件超过轮换周期 + 宽限期后不会再被写，
+# 合并完即可删除。读取方照常读规范表，看到的是所有分片合并后的总数 (滞后不超过一个压实周期)。
+def _closed_before(path, now):
+    try:
+        created = float(os.path.basename(path).rsplit("-", 1)[1][:-len(".log")])
+    except (IndexError, ValueError):
+        return False
+    return created < now - SHARD_ROTATE_SECONDS - SHARD_CLOSE_GRACE_SECONDS
+
+def _read_events(path, offset):
+    # 只读到最后一个完整行；写到一半的尾行留给下一轮
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:end].decode("utf-8", "replace").splitlines():
+        date, _, visitor_id = line.partition("\t")
+        if visitor_id:
+            events.append((visitor_id, date))
+    return events, offset + end
+
+def compact_shards(conn, shard_dir=SHARD_DIR, uv_mode=UV_MODE):
+    # 多个进程可能同时尝试压实：BEGIN IMMEDIATE 保证同一时刻只有一个在合并，列目录也在事务里做
+    merged = 0
+    consumed = []
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        paths = sorted(glob.glob(os.path.join(shard_dir, "*.log")))
+        offsets = dict(conn.execute("SELECT shard, offset FROM shard_offsets"))
+        for path in paths:
+            name = os.path.basename(path)
+            try:
+                events, offset = _read_events(path, offsets.get(name, 0))
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if events:
+                apply_events(conn, events, uv_mode)
+                merged += len(events)
+            if offset != offsets.get(name, 0):
+                conn.execute(
+                    "INSERT INTO shard_offsets (shard, offset) VALUES (?, ?) "
+                    "ON CONFLICT(shard) DO UPDATE SET offset = excluded.offset",
+                    (name, offset),
+                )
+            if _closed_before(path, now) and offset == size:
+                consumed.append(path)
+        # 偏移记录一直留到文件确认已删除：删除失败或删除前崩溃，下一轮从记录的偏移读，不会重复合并
+        listed = {os.path.basename(path) for path in paths}
+        conn.executemany("DELETE FROM shard_offsets WHERE shard = ?", [(name,) for name in offsets if name not in listed])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    # 已合并完的旧分片：删除失败时下一轮再试
+    for path in consumed:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return merged
+
+
+class ShardedVisitTracker(VisitTracker):
+    def __init__(self, db_file=DB_FILE, shard_dir=SHARD_DIR, compact_interval=COMPACT_INTERVAL_SECONDS, **kwargs):
+        self.shard_dir = shard_dir
+        self.compact_interval = compact_interval
+        os.makedirs(shard_dir, exist_ok=True)
+        self._shard = None
+        self._shard_created = 0.0
+        super().__init__(db_file, **kwargs)
+        self.counters.update({"compacted": 0, "compactions": 0, "compact_errors": 0})
+        self._compactor = threading.Thread(target=self._compact_loop, name="visit-compactor", daemon=True)
+        self._compactor.start()
+
+    def _shard_file(self):
+        now = time.time()
+        if self._shard is None or now - self._shard_created >= SHARD_ROTATE_SECONDS:
+            if self._shard is not None:
+                self._shard.close()
+            name = f"{socket.gethostname()}-{os.getpid()}-{now:.3f}.log"
+            self._shard = open(os.path.join(self.shard_dir, name), "ab")
+            self._shard_created = now
+        return self._shard
+
+    # 热路径：只追加本进程自己的文件，不碰数据库，也不和其他进程争锁
+    def _write_batch(self, batch):
+        payload = "".join(f"{date}\t{vid}\n" for vid, date in batch).encode("utf-8")
+        try:
+            shard = self._shard_file()
+            shard.write(payload)
+            shard.flush()
+        except OSError:
+            self._bump("failed", len(batch))
+            return
+        with self._counters_lock:
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+
+    def compact(self):
+        # 只持有写锁 (可能等其他副本的 BEGIN IMMEDIATE)；record_visit 只碰计数器锁，不受影响
+        try:
+            with self._write_lock:
+                merged = compact_shards(self._conn, self.shard_dir, self.uv_mode)
+            with self._counters_lock:
+                self.counters["compacted"] += merged
+                self.counters["compactions"] += 1
+            if merged:
+                self._counts_cache = (None, None, 0.0)
+        except (sqlite3.Error, OSError):
+            # 其他进程正在压实 (库被锁)、库暂时不可用或分片目录读不了：跳过本轮，压实线程不退出
+            self._bump("compact_errors")
+            return
+        self._maybe_prune()
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            self.compact()
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+        if self._shard is not None:
+            self._shard.close()
+        self.compact()
+        self._close_connections()
+
+
+@st.cache_resource(show_spinner=False)
+def get_tracker():
+    tracker = ShardedVisitTracker() if STATS_MODE == "sharded" else VisitTracker()
+    get_metrics().register_collector("visit_events", tracker.snapshot)
+    return tracker
+
+
+# 手动压实 (如定时任务里)：VISIT_STATS_MODE=sharded python stats.py compact
+if __name__ == "__main__":
+    if sys.argv[1:] != ["compact"]:
+        sys.exit("usage: python stats.py compact")
+    conn = sqlite3.connect(DB_FILE, timeout=30.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    print(f"merged {compact_shards(conn)} events from {SHARD_DIR} into {DB_FILE}")
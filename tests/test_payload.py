@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from check_payload import iter_figures  # noqa: E402
+from figures import PAYLOAD_BUDGET_BYTES, payload_bytes, slim_figure  # noqa: E402
+
+# 与 tools/check_payload.py 同一批图：每个模块图、时间序列和对比图 × 每种语言
+FIGURES = list(iter_figures())
+
+
+@pytest.mark.parametrize("name, lang, fig", FIGURES, ids=[f"{name}-{lang}" for name, lang, _ in FIGURES])
+def test_figure_within_budget(name, lang, fig):
+    size = payload_bytes(slim_figure(fig))
+    assert size <= PAYLOAD_BUDGET_BYTES[name], f"{name} ({lang}) is {size} bytes, budget {PAYLOAD_BUDGET_BYTES[name]}"
+
+def test_every_figure_has_a_budget():
+    assert {name for name, _, _ in FIGURES} == set(PAYLOAD_BUDGET_BYTES)
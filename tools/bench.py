@@ -0,0 +1,234 @@
+"""进程内基准测试：整页 rerun (Streamlit AppTest) + 关键函数微基准。
+
+用法:
+    python tools/bench.py                      # 运行并写入 bench_results/latest.json
+    python tools/bench.py --save-baseline      # 同时把本次结果存为基线
+    python tools/bench.py --repeat 20          # 每项重复次数
+有基线时自动对比，中位数变慢超过阈值的项会被标出，并以退出码 1 结束。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 统计/授权/指标写入临时目录，避免基准测试污染真实数据 (必须在导入 stats/access/metrics 之前设置)
+BENCH_DIR = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("VISIT_STATS_DB", os.path.join(BENCH_DIR, "bench_stats.db"))
+os.environ.setdefault("ACCESS_DB", os.path.join(BENCH_DIR, "bench_access.db"))
+os.environ.setdefault("APP_METRICS_FILE", os.path.join(BENCH_DIR, "bench_metrics.prom"))
+
+import plotly.graph_objects as go  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP_FILE = os.path.join(ROOT, "streamlit_app.py")
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, "latest.json")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+REGRESSION_THRESHOLD = 0.20  # 中位数变慢 20% 以上视为回归
+NOISE_FLOOR_MS = 0.5  # 绝对差值低于此值的波动不算回归
+
+LANGS = ("en", "zh", "es")
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {
+        "n": len(samples),
+        "min_ms": samples[0] * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": p95 * 1000,
+    }
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+# ------------------------------------------
+# 整页 rerun
+# ------------------------------------------
+def new_app(lang="en"):
+    at = AppTest.from_file(APP_FILE, default_timeout=60)
+    at.session_state["language"] = lang
+    return at
+
+def checked_run(at):
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+def bench_script_runs(repeat):
+    results = {}
+    # 视图切换在浏览器端完成，不触发 rerun；这里只测各语言的整页 rerun
+    for lang in LANGS:
+        at = new_app(lang)
+        checked_run(at)  # 首次运行：建立会话并预热缓存
+        results[f"rerun[{lang}]"] = timed(lambda at=at: checked_run(at), repeat)
+    return results
+
+def bench_cold_start():
+    st.cache_resource.clear()
+    at = new_app()
+    start = time.perf_counter()
+    checked_run(at)
+    return {"first_run_cold_cache": summarize([time.perf_counter() - start])}
+
+def bench_lang_switch(repeat):
+    at = new_app()
+    checked_run(at)
+
+    def toggle():
+        at.button(key="lang_switch").click()
+        checked_run(at)
+
+    return {"lang_switch": timed(toggle, repeat)}
+
+def bench_coffee_dialog(repeat):
+    at = new_app()
+    checked_run(at)
+
+    def open_dialog():
+        coffee_btn = next(b for b in at.button if b.label.startswith("☕"))
+        coffee_btn.click()
+        checked_run(at)
+
+    return {"open_coffee_dialog": timed(open_dialog, repeat)}
+
+
+# ------------------------------------------
+# 微基准
+# ------------------------------------------
+def bench_micro(repeat):
+    from derived import derive_views, get_timelines, get_view, get_views
+    from datasets import DATASET_NAMES, get_dataset
+    from figures import (
+        MODULE_CHARTS, TIMELINE_TEXT_KEYS, add_map_labels, build_map_figure, build_module_figure,
+        build_timeline_figure, module_texts, timeline_texts,
+    )
+    from stats import VisitTracker
+
+    results = {}
+
+    db_dir = tempfile.mkdtemp(prefix="bench-stats-")
+    tracker = VisitTracker(os.path.join(db_dir, "stats.db"), counts_ttl=0)
+    counter = iter(range(10 ** 9))
+
+    def track_once():
+        tracker.record_visit(f"bench-{next(counter)}")
+        tracker.read_counts()
+
+    results["track_stats"] = timed(track_once, repeat * 10)
+    tracker.close()
+
+    frames = [get_dataset(name).frame for name in DATASET_NAMES]
+    results["derive_views"] = timed(lambda: derive_views(*frames), repeat)
+
+    _, view = get_view("cocaine", "en")
+    results["add_map_labels"] = timed(lambda: add_map_labels(go.Figure(), view.map_frame), repeat)
+
+    for chart in ("cocaine", "fentanyl", "reserves", "production"):
+        _, view = get_view(chart, "en")
+        results[f"build_map_figure[{chart}]"] = timed(
+            lambda view=view, chart=chart: build_map_figure(chart, view.map_frame, "title", "label"), repeat
+        )
+
+    # 文案用键名本身，只测构图
+    get_txt = str
+    for module, charts in MODULE_CHARTS.items():
+        _, views = get_views(charts, "en")
+        results[f"build_module_figure[{module}]"] = timed(
+            lambda module=module, views=views: build_module_figure(module, views, module_texts(module, get_txt)), repeat
+        )
+
+    _, timelines = get_timelines(tuple(TIMELINE_TEXT_KEYS))
+    results["build_timeline_figure[oil]"] = timed(
+        lambda: build_timeline_figure(timelines, timeline_texts(get_txt)), repeat
+    )
+    return results
+
+
+# ------------------------------------------
+# 结果保存 + 回归对比
+# ------------------------------------------
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        delta = current["median_ms"] - base["median_ms"]
+        if delta > NOISE_FLOOR_MS and current["median_ms"] > base["median_ms"] * (1 + threshold):
+            regressions.append((name, base["median_ms"], current["median_ms"]))
+    return regressions
+
+def write_json(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = {}
+    results.update(bench_cold_start())
+    results.update(bench_script_runs(args.repeat))
+    results.update(bench_lang_switch(args.repeat))
+    results.update(bench_coffee_dialog(args.repeat))
+    results.update(bench_micro(args.repeat))
+
+    payload = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "machine": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    write_json(args.output, payload)
+
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}}  {'median':>9}  {'p95':>9}  {'min':>9}")
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['median_ms']:>7.2f}ms  {r['p95_ms']:>7.2f}ms  {r['min_ms']:>7.2f}ms")
+    print(f"\nresults -> {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, payload)
+        print(f"baseline -> {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"no regressions vs baseline ({baseline.get('created')})")
+        return 0
+    print(f"\nREGRESSIONS vs baseline ({baseline.get('created')}, threshold +{args.threshold:.0%}):")
+    for name, base, current in regressions:
+        print(f"  {name}: {base:.2f}ms -> {current:.2f}ms")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""从 Natural Earth 1:110m 国家边界生成本地地图资源。
+
+用法:
+    pip install pyshp
+    python tools/build_geo.py path/to/ne_110m_admin_0_countries.shp
+
+输出:
+    static/topojson/world_110m.json  Plotly.js 格式的世界 TopoJSON (countries 以 ISO-3 为 id)
+    data/countries.csv               国家维表：ISO3, 展示名, 标签坐标, 别名
+
+1:110m 的精度对应 450–500px 高的地图已经足够；坐标量化到 QUANTIZATION 网格并做差分编码。
+已有 data/countries.csv 中的展示名、标签坐标和别名会被保留 (手工调整过的标签位置不会被覆盖)。
+"""
+import csv
+import json
+import os
+import sys
+
+import shapefile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPOJSON_FILE = os.path.join(ROOT, "static", "topojson", "world_110m.json")
+COUNTRIES_FILE = os.path.join(ROOT, "data", "countries.csv")
+QUANTIZATION = 10000
+# Natural Earth 中 ISO_A3 为 -99 的国家
+ISO3_FIXES = {"Kosovo": "XKX", "France": "FRA", "Norway": "NOR", "N. Cyprus": "CYN", "Somaliland": "SOL"}
+# Plotly.js 会按图层名读取这些对象；我们只提供国家/陆地/海岸线，其余留空
+EMPTY_LAYERS = ("ocean", "lakes", "rivers", "subunits")
+
+
+def field(record, *names):
+    for name in names:
+        if name in record.as_dict():
+            return record[name]
+    raise KeyError(names)
+
+def ring_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+def ring_centroid(ring):
+    area = ring_area(ring)
+    if area == 0:
+        xs, ys = zip(*ring)
+        return sum(xs) / len(xs), sum(ys) / len(ys)
+    cx = cy = 0.0
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+        cross = x0 * y1 - x1 * y0
+        cx += (x0 + x1) * cross
+        cy += (y0 + y1) * cross
+    return cx / (6 * area), cy / (6 * area)
+
+def split_rings(shape):
+    # Shapefile 约定：外环顺时针 (面积为负)，内环 (洞) 逆时针；这也正是 d3-geo 需要的方向
+    bounds = list(shape.parts) + [len(shape.points)]
+    polygons = []
+    for start, end in zip(bounds, bounds[1:]):
+        ring = [tuple(p) for p in shape.points[start:end]]
+        if ring_area(ring) <= 0 or not polygons:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return polygons
+
+
+class TopologyBuilder:
+    def __init__(self, bbox):
+        self.x0, self.y0, x1, y1 = bbox
+        self.kx = (x1 - self.x0) / (QUANTIZATION - 1)
+        self.ky = (y1 - self.y0) / (QUANTIZATION - 1)
+        self.arcs = []
+
+    def quantize(self, ring):
+        points = [(round((x - self.x0) / self.kx), round((y - self.y0) / self.ky)) for x, y in ring]
+        deduped = [points[0]]
+        for p in points[1:]:
+            if p != deduped[-1]:
+                deduped.append(p)
+        return deduped
+
+    def add_arc(self, points):
+        encoded = [list(points[0])]
+        for (px, py), (x, y) in zip(points, points[1:]):
+            encoded.append([x - px, y - py])
+        self.arcs.append(encoded)
+        return len(self.arcs) - 1
+
+    def transform(self):
+        return {"scale": [self.kx, self.ky], "translate": [self.x0, self.y0]}
+
+
+def build(shp_path):
+    reader = shapefile.Reader(shp_path)
+    topo = TopologyBuilder(reader.bbox)
+    countries = []
+    quantized_rings = []  # 量化后的闭合环，用于找出海岸线
+
+    for shape_rec in reader.iterShapeRecords():
+        rec = shape_rec.record
+        name = field(rec, "NAME", "name")
+        iso3 = field(rec, "ISO_A3", "iso_a3")
+        if iso3 == "-99":
+            iso3 = ISO3_FIXES.get(name)
+        if not iso3:
+            continue
+        polygons = split_rings(shape_rec.shape)
+        largest = max(polygons, key=lambda poly: abs(ring_area(poly[0])))
+        lon, lat = ring_centroid(largest[0])
+
+        arcs = []
+        for poly in polygons:
+            poly_arcs = []
+            for ring in poly:
+                q = topo.quantize(ring)
+                if len(q) < 4:
+                    continue
+                quantized_rings.append(q)
+                poly_arcs.append([topo.add_arc(q)])
+            if poly_arcs:
+                arcs.append(poly_arcs)
+        countries.append({
+            "iso3": iso3, "name": name, "lat": round(lat, 2), "lon": round(lon, 2),
+            "geometry": {"type": "MultiPolygon", "arcs": arcs, "id": iso3, "properties": {"ct": [round(lon, 2), round(lat, 2)]}},
+        })
+
+    # 海岸线 = 只属于一个国家的边；两国共享的边是国界，不画成海岸线
+    edge_count = {}
+    for ring in quantized_rings:
+        for a, b in zip(ring, ring[1:]):
+            key = (a, b) if a <= b else (b, a)
+            edge_count[key] = edge_count.get(key, 0) + 1
+    coast_arcs = []
+    for ring in quantized_rings:
+        run = []
+        for a, b in zip(ring, ring[1:]):
+            key = (a, b) if a <= b else (b, a)
+            if edge_count[key] == 1:
+                run = run or [a]
+                run.append(b)
+            elif run:
+                coast_arcs.append([topo.add_arc(run)])
+                run = []
+        if run:
+            coast_arcs.append([topo.add_arc(run)])
+
+    objects = {
+        "countries": {"type": "GeometryCollection", "geometries": [c["geometry"] for c in countries]},
+        "land": {"type": "MultiPolygon", "arcs": [poly for c in countries for poly in c["geometry"]["arcs"]]},
+        "coastlines": {"type": "MultiLineString", "arcs": coast_arcs},
+    }
+    for layer in EMPTY_LAYERS:
+        objects[layer] = {"type": "GeometryCollection", "geometries": []}
+    topology = {"type": "Topology", "transform": topo.transform(), "objects": objects, "arcs": topo.arcs}
+    return topology, countries
+
+
+def load_existing_countries():
+    if not os.path.exists(COUNTRIES_FILE):
+        return {}
+    with open(COUNTRIES_FILE, encoding="utf-8", newline="") as f:
+        return {row["ISO3"]: row for row in csv.DictReader(f)}
+
+def write_countries(countries):
+    existing = load_existing_countries()
+    rows = []
+    for c in countries:
+        old = existing.get(c["iso3"])
+        if old:
+            rows.append(old)
+            continue
+        rows.append({"ISO3": c["iso3"], "Country": c["name"], "lat": c["lat"], "lon": c["lon"], "Aliases": ""})
+    rows.sort(key=lambda row: row["ISO3"])
+    with open(COUNTRIES_FILE, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["ISO3", "Country", "lat", "lon", "Aliases"], lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+def main(argv):
+    if len(argv) != 1:
+        sys.exit(__doc__)
+    topology, countries = build(argv[0])
+    os.makedirs(os.path.dirname(TOPOJSON_FILE), exist_ok=True)
+    with open(TOPOJSON_FILE, "w", encoding="utf-8") as f:
+        json.dump(topology, f, separators=(",", ":"))
+    rows = write_countries(countries)
+    print(f"{len(countries)} countries -> {TOPOJSON_FILE} ({os.path.getsize(TOPOJSON_FILE) / 1024:.0f} KB)")
+    print(f"{len(rows)} rows -> {COUNTRIES_FILE}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,57 @@
+"""检查每张图发给浏览器的 Plotly JSON 体积是否超出预算 (figures.PAYLOAD_BUDGET_BYTES)。
+
+用法:
+    python tools/check_payload.py          # 逐图打印字节数，超预算时以退出码 1 结束
+    python tools/check_payload.py --raw    # 同时打印瘦身前的字节数，便于对比
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from derived import get_comparison, get_timelines, get_views  # noqa: E402
+from figures import (  # noqa: E402
+    MODULE_CHARTS, PAYLOAD_BUDGET_BYTES, TIMELINE_TEXT_KEYS, build_comparison_figure, build_module_figure,
+    build_timeline_figure, comparison_texts, module_texts, payload_bytes, slim_figure, timeline_texts,
+)
+from i18n import LANGS, get_catalog  # noqa: E402
+
+
+def iter_figures():
+    for lang in LANGS:
+        get_txt = get_catalog(lang).get
+        for module, charts in MODULE_CHARTS.items():
+            _, views = get_views(charts, lang)
+            yield f"module:{module}", lang, build_module_figure(module, views, module_texts(module, get_txt))
+        _, timelines = get_timelines(tuple(TIMELINE_TEXT_KEYS))
+        yield "timeline:oil", lang, build_timeline_figure(timelines, timeline_texts(get_txt))
+        _, frame = get_comparison()
+        yield "comparison", lang, build_comparison_figure(frame, comparison_texts(get_txt))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--raw", action="store_true")
+    args = parser.parse_args(argv)
+
+    over = []
+    print(f"{'figure':<22} {'lang':<5} {'bytes':>7} {'budget':>7}" + (f" {'raw':>7}" if args.raw else ""))
+    for name, lang, fig in iter_figures():
+        raw = payload_bytes(fig) if args.raw else None
+        size = payload_bytes(slim_figure(fig))
+        budget = PAYLOAD_BUDGET_BYTES[name]
+        flag = "  OVER" if size > budget else ""
+        print(f"{name:<22} {lang:<5} {size:>7} {budget:>7}" + (f" {raw:>7}" if args.raw else "") + flag)
+        if size > budget:
+            over.append((name, lang, size, budget))
+
+    if over:
+        print(f"\n{len(over)} figure(s) over budget")
+        return 1
+    print("\nall figures within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
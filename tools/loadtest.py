@@ -0,0 +1,413 @@
+"""端到端并发压测：在本机启动 streamlit_app.py，用 N 个模拟会话走 Streamlit 的 websocket 协议。
+
+用法:
+    python tools/loadtest.py                        # 20 个并发会话，写入 loadtest_results/latest.json
+    python tools/loadtest.py --sessions 100 --ramp 10
+    python tools/loadtest.py --prewarm              # 经 warmup.py 启动 (预热完成后才开始监听)
+    python tools/loadtest.py --save-baseline        # 同时把本次结果存为基线
+每个会话按脚本执行交互：首次加载、切换语言、打开咖啡对话框、在对话框里选预设
+(地图视图切换在浏览器端完成，不经过服务器，不在压测范围内)。
+报告每种交互的 p50/p99 渲染耗时 (发出 BackMsg 到收到 script_finished)、服务端 CPU 与 RSS
+(总量和每会话均摊，读 /proc，仅 Linux)，以及 track_stats 的 SQLite 写入/读取失败率
+(取自服务端的 Prometheus 指标文件)。有基线时自动对比，p50/p99 变慢超过阈值时以退出码 1 结束。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+import websockets  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+
+from i18n import DEFAULT_LANG, get_text, next_lang  # noqa: E402
+
+APP_FILE = os.path.join(ROOT, "streamlit_app.py")
+WARMUP_FILE = os.path.join(ROOT, "warmup.py")
+RESULTS_DIR = os.path.join(ROOT, "loadtest_results")
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, "latest.json")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+REGRESSION_THRESHOLD = 0.20
+NOISE_FLOOR_MS = 5.0  # 网络往返带来的抖动比进程内基准大
+STARTUP_TIMEOUT_SECONDS = 60.0
+METRICS_DUMP_SECONDS = 1.0  # 压测期间服务端写指标文件的间隔
+RSS_SAMPLE_SECONDS = 0.5
+
+# 会话脚本：(名称, 权重, 交互序列)；会话按权重随机分配脚本
+SCRIPTS = (
+    ("reader", 6, ("load",)),
+    ("switcher", 3, ("load", "lang_switch", "lang_switch")),
+    ("supporter", 1, ("load", "coffee_dialog", "coffee_preset")),
+)
+FINISHED_EARLY = ForwardMsg.ScriptFinishedStatus.Value("FINISHED_EARLY_FOR_RERUN")
+METRIC_LINE_RE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+
+def _quantile(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))]
+
+def summarize(samples, errors):
+    samples = sorted(samples)
+    row = {"n": len(samples), "errors": errors}
+    if samples:
+        row.update({
+            "p50_ms": _quantile(samples, 0.50) * 1000,
+            "p99_ms": _quantile(samples, 0.99) * 1000,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "max_ms": samples[-1] * 1000,
+        })
+    return row
+
+
+# ------------------------------------------
+# 服务端进程
+# ------------------------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port, prewarm, env, log_path):
+    script = [WARMUP_FILE] if prewarm else ["-m", "streamlit", "run", APP_FILE]
+    cmd = [sys.executable, *script, "--server.headless", "true", "--server.port", str(port),
+           "--browser.gatherUsageStats", "false"]
+    log = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    started = time.perf_counter()
+    deadline = started + STARTUP_TIMEOUT_SECONDS
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}, see {log_path}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as resp:
+                if resp.status == 200:
+                    return proc, time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server not healthy after {STARTUP_TIMEOUT_SECONDS:.0f}s, see {log_path}")
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+class ProcessSampler:
+    # /proc/<pid>/stat 的 utime+stime 与 /proc/<pid>/status 的 VmRSS；非 Linux 时都为 None
+    def __init__(self, pid):
+        self.pid = pid
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.rss_peak = 0
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss = int(line.split()[1]) * 1024
+                        self.rss_peak = max(self.rss_peak, rss)
+                        return rss
+        except OSError:
+            pass
+        return None
+
+    async def watch(self, stop):
+        while not stop.is_set():
+            self.rss_bytes()
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+
+def read_server_metrics(path):
+    # 解析服务端写出的 Prometheus 文本：visit_events 计数器 + track_stats 分区
+    events, track_stats = {}, {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        match = METRIC_LINE_RE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        if name == "app_visit_events_total":
+            events[labels["kind"]] = float(value)
+        elif labels.get("section") == "track_stats":
+            if name == "app_section_seconds" and labels.get("quantile") == "0.99":
+                track_stats["p99_ms"] = float(value) * 1000
+            elif name == "app_section_seconds_count":
+                track_stats["calls"] = int(float(value))
+            elif name == "app_section_errors_total":
+                track_stats["errors"] = int(float(value))
+    failed = events.get("failed", 0) + events.get("dropped", 0) + events.get("read_errors", 0)
+    return {
+        "visit_events": events,
+        "track_stats": track_stats,
+        "error_rate": failed / max(1.0, events.get("queued", 0)),
+    }
+
+
+# ------------------------------------------
+# 模拟会话
+# ------------------------------------------
+class Session:
+    def __init__(self, url, timeout, results):
+        self.url = url
+        self.timeout = timeout
+        self.results = results  # 交互名 -> {"samples": [...], "errors": n}
+        self.client_id = secrets.token_urlsafe(16)  # 每个会话一条新的试用记录
+        self.lang = DEFAULT_LANG
+        self.buttons = {}  # 控件 id -> (标签, fragment_id)
+        self.ws = None
+
+    def _record(self, name, seconds=None):
+        entry = self.results.setdefault(name, {"samples": [], "errors": 0})
+        if seconds is None:
+            entry["errors"] += 1
+        else:
+            entry["samples"].append(seconds)
+
+    async def _rerun(self, widget_id=None, fragment_id=""):
+        msg = BackMsg()
+        msg.rerun_script.query_string = f"client={self.client_id}"
+        msg.rerun_script.fragment_id = fragment_id
+        if widget_id is not None:
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            state.trigger_value = True
+        await self.ws.send(msg.SerializeToString())
+        if not fragment_id:
+            self.buttons = {}
+        failed = False
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                if element.WhichOneof("type") == "button":
+                    self.buttons[element.button.id] = (element.button.label, fwd.delta.fragment_id)
+                elif element.WhichOneof("type") == "exception":
+                    failed = True
+            elif kind == "script_finished" and fwd.script_finished != FINISHED_EARLY:
+                return not failed
+
+    def _find_button(self, predicate):
+        for widget_id, (label, fragment_id) in self.buttons.items():
+            if predicate(widget_id, label):
+                return widget_id, fragment_id
+        raise LookupError("button not found")
+
+    async def _interact(self, name):
+        if name == "lang_switch":
+            widget_id, fragment_id = self._find_button(lambda wid, label: wid.endswith("-lang_switch"))
+        elif name == "coffee_dialog":
+            coffee_label = get_text(self.lang, "coffee_btn")
+            widget_id, fragment_id = self._find_button(lambda wid, label: label == coffee_label)
+        elif name == "coffee_preset":
+            key = f"-p_btn_{random.randrange(3)}"
+            widget_id, fragment_id = self._find_button(lambda wid, label: wid.endswith(key))
+        else:
+            raise ValueError(f"unknown interaction {name!r}")
+        ok = await self._rerun(widget_id, fragment_id)
+        if name == "lang_switch":
+            self.lang = next_lang(self.lang)
+        return ok
+
+    async def run(self, steps, think_seconds):
+        name, start = "load", time.perf_counter()
+        try:
+            # 首次加载从建立连接算起
+            self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+            ok = await asyncio.wait_for(self._rerun(), self.timeout)
+            self._record(name, time.perf_counter() - start if ok else None)
+            for name in steps[1:]:
+                await asyncio.sleep(think_seconds * random.uniform(0.5, 1.5))
+                start = time.perf_counter()
+                ok = await asyncio.wait_for(self._interact(name), self.timeout)
+                self._record(name, time.perf_counter() - start if ok else None)
+            return True
+        except (OSError, asyncio.TimeoutError, LookupError, websockets.WebSocketException):
+            # 连接断开、超时或找不到要点的按钮：记为该交互出错，会话结束
+            self._record(name)
+            return False
+        finally:
+            if self.ws is not None:
+                await self.ws.close()
+
+async def run_sessions(url, sessions, ramp_seconds, think_seconds, timeout, sampler):
+    results = {}
+    names, weights, steps = zip(*SCRIPTS)
+    assigned = random.choices(range(len(SCRIPTS)), weights=weights, k=sessions)
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(sampler.watch(stop)) if sampler else None
+
+    async def start_one(i):
+        await asyncio.sleep(ramp_seconds * i / max(1, sessions))
+        return await Session(url, timeout, results).run(steps[assigned[i]], think_seconds)
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(start_one(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if watcher:
+        await watcher
+    scripts = {name: assigned.count(i) for i, name in enumerate(names)}
+    return results, {"started": sessions, "completed": sum(outcomes), "scripts": scripts, "elapsed_seconds": elapsed}
+
+
+# ------------------------------------------
+# 结果保存 + 回归对比
+# ------------------------------------------
+def compare(interactions, baseline, threshold):
+    regressions = []
+    for name, current in interactions.items():
+        base = baseline.get("interactions", {}).get(name)
+        if not base or "p50_ms" not in base or "p50_ms" not in current:
+            continue
+        for stat in ("p50_ms", "p99_ms"):
+            delta = current[stat] - base[stat]
+            if delta > NOISE_FLOOR_MS and current[stat] > base[stat] * (1 + threshold):
+                regressions.append((f"{name} {stat[:-3]}", base[stat], current[stat]))
+    return regressions
+
+def write_json(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+
+def print_report(payload):
+    interactions = payload["interactions"]
+    width = max([len("interaction")] + [len(name) for name in interactions])
+    print(f"{'interaction':<{width}}  {'n':>5}  {'err':>4}  {'p50':>9}  {'p99':>9}")
+    for name, r in interactions.items():
+        if r["n"]:
+            print(f"{name:<{width}}  {r['n']:>5}  {r['errors']:>4}  {r['p50_ms']:>7.1f}ms  {r['p99_ms']:>7.1f}ms")
+        else:
+            print(f"{name:<{width}}  {r['n']:>5}  {r['errors']:>4}")
+    sessions = payload["sessions"]
+    print(f"\nsessions: {sessions['completed']}/{sessions['started']} completed in {sessions['elapsed_seconds']:.1f}s")
+    server = payload["server"]
+    if server.get("cpu_seconds") is not None:
+        print(f"server: startup {server['startup_seconds']:.1f}s, cpu {server['cpu_seconds']:.2f}s "
+              f"({server['cpu_ms_per_session']:.0f}ms/session), rss {server['rss_baseline_mb']:.0f}MB -> "
+              f"peak {server['rss_peak_mb']:.0f}MB ({server['rss_kb_per_session']:.0f}KB/session)")
+    stats = payload["stats"]
+    if stats:
+        events = stats["visit_events"]
+        print(f"track_stats: {stats['track_stats'].get('calls', 0)} calls, "
+              f"queued {events.get('queued', 0):.0f}, written {events.get('written', 0):.0f}, "
+              f"failed {events.get('failed', 0):.0f}, read errors {events.get('read_errors', 0):.0f}, "
+              f"error rate {stats['error_rate']:.2%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions connect")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between interactions (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-interaction timeout (s)")
+    parser.add_argument("--prewarm", action="store_true", help="start the server through warmup.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    # 统计/授权/指标写入临时目录，避免污染真实数据；环境里已设置的路径优先
+    work_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ)
+    env.setdefault("VISIT_STATS_DB", os.path.join(work_dir, "stats.db"))
+    env.setdefault("ACCESS_DB", os.path.join(work_dir, "access.db"))
+    env.setdefault("APP_METRICS_FILE", os.path.join(work_dir, "metrics.prom"))
+    env["APP_METRICS_DUMP_SECONDS"] = str(METRICS_DUMP_SECONDS)
+    port = free_port()
+    proc, startup_seconds = start_server(port, args.prewarm, env, os.path.join(work_dir, "server.log"))
+    try:
+        sampler = ProcessSampler(proc.pid)
+        cpu_before, rss_before = sampler.cpu_seconds(), sampler.rss_bytes()
+        results, sessions = asyncio.run(run_sessions(
+            f"ws://127.0.0.1:{port}/_stcore/stream", args.sessions, args.ramp, args.think, args.timeout, sampler,
+        ))
+        cpu_after = sampler.cpu_seconds()
+        # 等访问事件写库、指标文件再落盘一次
+        time.sleep(METRICS_DUMP_SECONDS * 3)
+        stats = read_server_metrics(env["APP_METRICS_FILE"].replace("{pid}", str(proc.pid)))
+    finally:
+        stop_server(proc)
+
+    server = {"startup_seconds": startup_seconds, "prewarm": args.prewarm, "cpu_seconds": None}
+    if cpu_before is not None and cpu_after is not None:
+        server.update({
+            "cpu_seconds": cpu_after - cpu_before,
+            "cpu_ms_per_session": (cpu_after - cpu_before) / args.sessions * 1000,
+            "rss_baseline_mb": rss_before / 2 ** 20,
+            "rss_peak_mb": sampler.rss_peak / 2 ** 20,
+            "rss_kb_per_session": (sampler.rss_peak - rss_before) / args.sessions / 1024,
+        })
+    interactions = {name: summarize(r["samples"], r["errors"]) for name, r in sorted(results.items())}
+    payload = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "machine": platform.platform(),
+        "config": {key: getattr(args, key) for key in ("sessions", "ramp", "think", "timeout", "prewarm", "seed")},
+        "sessions": sessions,
+        "interactions": interactions,
+        "server": server,
+        "stats": stats,
+    }
+    write_json(args.output, payload)
+    print_report(payload)
+    print(f"\nresults -> {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, payload)
+        print(f"baseline -> {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(interactions, baseline, args.threshold)
+    if not regressions:
+        print(f"no regressions vs baseline ({baseline.get('created')})")
+        return 0
+    print(f"\nREGRESSIONS vs baseline ({baseline.get('created')}, threshold +{args.threshold:.0%}):")
+    for name, base, current in regressions:
+        print(f"  {name}: {base:.1f}ms -> {current:.1f}ms")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import contextlib
+import os
+import sys
+import time
+
+# ==========================================
+# 冷启动预热：进程启动时、第一个会话到来之前把所有进程级缓存填满
+# ==========================================
+# `python warmup.py [streamlit 参数]` 先导入应用模块、加载数据集、生成各语言的派生表、全部图表和下载文件、
+# 打开统计/授权库，再在同一进程里启动 Streamlit；端口在预热完成后才开始监听，
+# 负载均衡不会把用户派给还没热起来的副本。各阶段耗时写入 cold_start_seconds 指标 (运维页可见)。
+# `python warmup.py --check` 只预热并打印各阶段耗时，超出预算时以退出码 1 结束。
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+IMPORT_BUDGET_SECONDS = 2.0  # 导入 streamlit + 应用模块 (不含 plotly/PIL，它们在构图/生成图片时才导入)
+COLD_START_BUDGET_SECONDS = 5.0  # 导入 + 全部预热
+PAY_IMAGES = ("wechat_pay.jpg", "ali_pay.jpg", "paypal.png")
+
+_process_started = time.perf_counter()
+
+
+@contextlib.contextmanager
+def _stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+def warm_up():
+    timings = {}
+    with _stage(timings, "imports"):
+        import access
+        import derived
+        import exports
+        import figures
+        import i18n
+        import payments
+        import stats
+        from metrics import get_metrics
+
+    with _stage(timings, "datasets"):
+        derived.get_base()
+
+    # 与 streamlit_app.py 的调用参数完全一致，才能命中同一批缓存条目
+    with _stage(timings, "views"):
+        for lang in i18n.LANGS:
+            derived.get_views(tuple(figures.MAP_TEXT_KEYS), lang)
+
+    with _stage(timings, "figures"):
+        for lang in i18n.LANGS:
+            get_txt = i18n.get_catalog(lang).get
+            for module, charts in figures.MODULE_CHARTS.items():
+                data_version, views = derived.get_views(charts, lang)
+                figures.get_module_figure(module, lang, data_version, views, figures.module_texts(module, get_txt))
+            data_version, timelines = derived.get_timelines(tuple(figures.TIMELINE_TEXT_KEYS))
+            figures.get_timeline_figure(lang, data_version, timelines, figures.timeline_texts(get_txt))
+            data_version, frame = derived.get_comparison()
+            figures.get_comparison_figure(lang, data_version, frame, figures.comparison_texts(get_txt))
+
+    with _stage(timings, "exports"):
+        for lang in i18n.LANGS:
+            exports.get_exports(lang)
+
+    with _stage(timings, "stores"):
+        stats.get_tracker()
+        access.get_access_store()
+
+    with _stage(timings, "assets"):
+        for filename in PAY_IMAGES:
+            payments.load_pay_image(filename)
+
+    timings["total"] = time.perf_counter() - _process_started
+    metrics = get_metrics()
+    for name, seconds in timings.items():
+        metrics.set_gauge("cold_start_seconds", name, round(seconds, 3))
+    return timings
+
+def format_timings(timings):
+    return "cold start: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+
+def over_budget(timings):
+    over = []
+    if timings["imports"] > IMPORT_BUDGET_SECONDS:
+        over.append(f"imports {timings['imports']:.2f}s > {IMPORT_BUDGET_SECONDS:.1f}s")
+    if timings["total"] > COLD_START_BUDGET_SECONDS:
+        over.append(f"total {timings['total']:.2f}s > {COLD_START_BUDGET_SECONDS:.1f}s")
+    return over
+
+
+def main(argv):
+    timings = warm_up()
+    print(format_timings(timings), flush=True)
+    if argv[:1] == ["--check"]:
+        over = over_budget(timings)
+        for line in over:
+            print(f"OVER BUDGET: {line}")
+        return 1 if over else 0
+
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", APP_SCRIPT, *argv]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))